@@ -0,0 +1,97 @@
+"""
+Сквозной бенчмарк опроса на локальной копии сайта (replay_server.py).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_pipeline.py --rows 1000 --churn 0.05 --polls 20
+    python benchmarks/bench_pipeline.py --browser --polls 3   # опрос через Chrome
+    python benchmarks/bench_pipeline.py --snapshots recordings/
+
+Для каждого опроса замеряется время от запроса страницы до готовых
+Prediction для новых и измененных строк и число таких строк.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from replay_server import ReplaySite, ReplayServerThread
+from http_fetcher import ValuebetsHttpClient
+
+def report(label, timings, changed):
+    total = sum(timings)
+    print(f"{label:<8} опросов {len(timings):>4}  медиана {statistics.median(timings) * 1000:>9.2f} мс  "
+          f"макс {max(timings) * 1000:>9.2f} мс  строк {sum(changed):>7}  "
+          f"{sum(changed) / total if total else 0:>9.0f} строк/с")
+
+async def sign_in(base_url, cookies_file):
+    """Входит на локальный сайт и сохраняет куки в формате Selenium, как это делает парсер."""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{base_url}/users/sign_in", allow_redirects=False,
+                                data={'user[email]': 'bench@example.com', 'user[password]': 'bench'}) as response:
+            cookies = [{'name': name, 'value': morsel.value, 'path': '/'} for name, morsel in response.cookies.items()]
+    with open(cookies_file, 'w') as f:
+        json.dump(cookies, f)
+
+async def bench_http(base_url, polls, work_dir):
+    cookies_file = str(Path(work_dir) / 'cookies.json')
+    await sign_in(base_url, cookies_file)
+    client = ValuebetsHttpClient(f"{base_url}/valuebets", cookies_file)
+    timings = []
+    changed = []
+    try:
+        for _ in range(polls):
+            start = time.perf_counter()
+            predictions, _ = await client.fetch_prediction_changes()
+            timings.append(time.perf_counter() - start)
+            changed.append(len(predictions))
+    finally:
+        await client.close()
+    report('http', timings, changed)
+
+def bench_browser(base_url, polls, work_dir):
+    from parser import SportscheckerParser
+
+    parser = SportscheckerParser('bench@example.com', 'bench', base_url=base_url)
+    parser.cookies_file = str(Path(work_dir) / 'browser_cookies.json')
+    parser.first_session = True
+    timings = []
+    changed = []
+    try:
+        for _ in range(polls):
+            start = time.perf_counter()
+            predictions, _ = parser.get_prediction_changes()
+            timings.append(time.perf_counter() - start)
+            changed.append(len(predictions))
+    finally:
+        parser.close()
+    report('browser', timings, changed)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--rows', type=int, default=1000)
+    arg_parser.add_argument('--churn', type=float, default=0.05)
+    arg_parser.add_argument('--latency', type=float, default=0.0)
+    arg_parser.add_argument('--polls', type=int, default=20)
+    arg_parser.add_argument('--snapshots', help="папка со снимками, записанными парсером")
+    arg_parser.add_argument('--browser', action='store_true', help="также замерить опрос через Chrome")
+    args = arg_parser.parse_args()
+
+    site = ReplaySite(rows=args.rows, churn=args.churn, latency=args.latency, snapshots_dir=args.snapshots)
+    with ReplayServerThread(site) as server, tempfile.TemporaryDirectory() as work_dir:
+        print(f"Локальный сайт: {server.base_url}")
+        asyncio.run(bench_http(server.base_url, args.polls, work_dir))
+        if args.browser:
+            bench_browser(server.base_url, args.polls, work_dir)
+    print(f"Запросы к сайту: {site.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Бенчмарк разбора таблицы valuebets.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_valuebets_parse.py
+    python benchmarks/bench_valuebets_parse.py --webdriver   # сравнение с путями WebDriver (нужен Chrome)
+
+Страницы на 10, 100 и 1000 строк создаются в benchmarks/fixtures при первом
+запуске. Любые другие *.html из этой папки (например, сохраненные с живого
+сайта) тоже участвуют в замере.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from valuebets_html import parse_valuebets_html
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+FIXTURE_ROWS = (10, 100, 1000)
+
+BOOKMAKERS = ['Betboom (RU)', 'Fonbet (RU)', 'Marathon (RU)', 'Olimp (Bet)', 'Winline (RU)']
+SPORTS = ['Футбол', 'Теннис', 'Хоккей', 'Баскетбол', 'Волейбол']
+MARKETS = ['П1', 'П2', 'Х', 'ТБ(2.5)', 'ТМ(3.5)', 'Ф1(-1.5)']
+
+ROW_TEMPLATE = """<tbody class="valuebet_record" data-id="{record_id}">
+<tr>
+  <td class="booker"><a href="/bookmakers/{bk_slug}">{bookmaker}</a><span class="minor">(RU)</span><span class="minor">{sport}</span></td>
+  <td class="time">{day:02d}/{month:02d}<br>{hour:02d}:{minute:02d}</td>
+  <td class="event"><a href="/events/{record_id}" target="_blank">Команда {home} - Команда {away}</a><span class="minor">Турнир {tournament}</span></td>
+  <td class="coeff"><abbr title="{market}">{market}</abbr></td>
+  <td class="value"><a href="#">{odd:.2f}</a></td>
+  <td class="profit"><span class="overvalue">{overvalue:.2f}%</span></td>
+</tr>
+</tbody>
+"""
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Валуйные ставки</title></head>
+<body>
+<nav><a href="/valuebets">Валуйные ставки</a><a href="/users/sign_out" data-method="delete">Выйти</a></nav>
+<button id="ft" type="button">Фильтр</button>
+<table id="valuebets-table">
+<thead><tr><th>БК</th><th>Время</th><th>Событие</th><th>Прогноз</th><th>Кэф</th><th>Перевес</th></tr></thead>
+{rows}</table>
+</body></html>
+"""
+
+def build_rows(row_count, seed=0, first_id=100000):
+    """Детерминированные строки таблицы valuebets (HTML tbody) с id записей от first_id."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(row_count):
+        bookmaker = rng.choice(BOOKMAKERS)
+        rows.append(ROW_TEMPLATE.format(
+            record_id=first_id + i,
+            bk_slug=bookmaker.split()[0].lower(),
+            bookmaker=bookmaker,
+            sport=rng.choice(SPORTS),
+            day=rng.randint(1, 28),
+            month=rng.randint(1, 12),
+            hour=rng.randint(0, 23),
+            minute=rng.choice((0, 15, 30, 45)),
+            home=rng.randint(1, 500),
+            away=rng.randint(1, 500),
+            tournament=rng.randint(1, 50),
+            market=rng.choice(MARKETS),
+            odd=rng.uniform(1.2, 6.0),
+            overvalue=rng.uniform(1.0, 15.0),
+        ))
+    return rows
+
+def build_page(row_count, seed=0):
+    """Детерминированная страница valuebets с заданным числом строк."""
+    return PAGE_TEMPLATE.format(rows=''.join(build_rows(row_count, seed)))
+
+def ensure_fixtures():
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    for row_count in FIXTURE_ROWS:
+        path = FIXTURES_DIR / f"valuebets_{row_count}.html"
+        if not path.exists():
+            path.write_text(build_page(row_count), encoding='utf-8')
+    return sorted(FIXTURES_DIR.glob("*.html"), key=lambda p: (p.stat().st_size, p.name))
+
+def measure(func, repeats):
+    """Возвращает (медиана секунд, число строк, пик памяти, число выделенных блоков)."""
+    timings = []
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = len(func())
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return statistics.median(timings), rows, peak, blocks
+
+def report(label, fixture, median, rows, peak, blocks):
+    rate = rows / median if median else float('inf')
+    print(f"{label:<10} {fixture:<28} {rows:>6} строк  {median * 1000:>9.2f} мс  "
+          f"{rate:>11.0f} строк/с  пик {peak / 1024:>8.1f} КБ  блоков {blocks:>7}")
+
+def bench_webdriver(fixtures, repeats):
+    """Те же страницы, открытые в Chrome через file://, для сравнения с путями WebDriver."""
+    from parser import SportscheckerParser
+
+    parser = SportscheckerParser('', '')
+    parser.driver = parser._setup_driver()
+    if not parser.driver:
+        print("Не удалось запустить Chrome, сравнение с WebDriver пропущено")
+        return
+    try:
+        for path in fixtures:
+            parser.driver.get(path.resolve().as_uri())
+            for label, func in (('js', lambda: list(parser._iter_rows_js())),
+                                ('html', lambda: list(parser._iter_rows_html())),
+                                ('webdriver', lambda: list(parser._iter_rows_webdriver()))):
+                report(label, path.name, *measure(func, repeats))
+    finally:
+        parser.close()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeats', type=int, default=int(os.environ.get('BENCH_REPEATS', 20)))
+    arg_parser.add_argument('--webdriver', action='store_true', help="также замерить извлечение через запущенный Chrome")
+    args = arg_parser.parse_args()
+
+    fixtures = ensure_fixtures()
+    for path in fixtures:
+        page_html = path.read_text(encoding='utf-8')
+        report('lxml', path.name, *measure(lambda: parse_valuebets_html(page_html), args.repeats))
+
+    if args.webdriver:
+        bench_webdriver(fixtures, max(1, args.repeats // 10))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Локальная копия сайта valuebets для бенчмарков и проверок без живого сайта.
+
+Запуск из корня репозитория:
+    python benchmarks/replay_server.py --rows 500 --latency 0.2
+    python benchmarks/replay_server.py --snapshots recordings/
+
+Страницы берутся из снимков, записанных парсером (record_dir, в config.json -
+RECORD_DIR): sign_in_*.html отдается как форма входа, valuebets_*.html - по
+кругу на каждый запрос таблицы. Без снимков страницы генерируются: форма с
+user_email и user_password, кнопка #ft и таблица #valuebets-table с заданным
+числом строк, из которых доля --churn заменяется новыми на каждом запросе.
+
+Парсер направляется сюда через base_url (в config.json - SITE_URL,
+например http://127.0.0.1:8089).
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import secrets
+import sys
+import threading
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_valuebets_parse import PAGE_TEMPLATE, build_rows
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = '_replay_session'
+
+SIGN_IN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Вход</title></head>
+<body>
+<form id="new_user" action="/users/sign_in" method="post">
+  <input type="email" id="user_email" name="user[email]">
+  <input type="password" id="user_password" name="user[password]">
+  <button type="submit" id="sign-in-form-submit-button">Войти</button>
+</form>
+</body></html>
+"""
+
+
+class ReplaySite:
+    """
+    Состояние локального сайта: выданные сессии, снимки или параметры
+    генерации таблицы и счетчики запросов.
+    """
+    def __init__(self, rows=100, churn=0.0, latency=0.0, jitter=0.0, snapshots_dir=None, seed=0):
+        self.rows = rows
+        self.churn = churn
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.sessions = set()
+        self.revision = 0
+        self.stats = {'sign_in': 0, 'logins': 0, 'valuebets': 0, 'redirects': 0}
+        self._rng = random.Random(seed)
+        self._sign_in_page = SIGN_IN_PAGE
+        self._snapshots = None
+
+        if snapshots_dir:
+            snapshots_dir = Path(snapshots_dir)
+            sign_in_pages = sorted(snapshots_dir.glob('sign_in_*.html'))
+            valuebets_pages = sorted(snapshots_dir.glob('valuebets_*.html'))
+            if sign_in_pages:
+                self._sign_in_page = sign_in_pages[-1].read_text(encoding='utf-8')
+            if valuebets_pages:
+                pages = [path.read_text(encoding='utf-8') for path in valuebets_pages]
+                self._snapshots = itertools.cycle(pages)
+                logger.info(f"Загружено {len(pages)} снимков таблицы из {snapshots_dir}")
+
+    def valuebets_page(self):
+        """Следующая версия страницы ставок."""
+        if self._snapshots is not None:
+            return next(self._snapshots)
+
+        # Первые строки не меняются, последние churn * rows - новые на каждой ревизии
+        changed = min(self.rows, round(self.rows * self.churn))
+        stable = build_rows(self.rows - changed, self.seed)
+        fresh = build_rows(changed, self.seed + self.revision + 1, first_id=1000000 * (self.revision + 1))
+        self.revision += 1
+        return PAGE_TEMPLATE.format(rows=''.join(stable + fresh))
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+
+    def is_signed_in(self, request):
+        return request.cookies.get(SESSION_COOKIE) in self.sessions
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle_root)
+        app.router.add_get('/users/sign_in', self.handle_sign_in_page)
+        app.router.add_post('/users/sign_in', self.handle_sign_in)
+        app.router.add_route('*', '/users/sign_out', self.handle_sign_out)
+        app.router.add_get('/valuebets', self.handle_valuebets)
+        return app
+
+    async def handle_root(self, request):
+        raise web.HTTPFound('/valuebets')
+
+    async def handle_sign_in_page(self, request):
+        self.stats['sign_in'] += 1
+        await self.delay()
+        return web.Response(text=self._sign_in_page, content_type='text/html')
+
+    async def handle_sign_in(self, request):
+        form = await request.post()
+        await self.delay()
+        if not form.get('user[email]') or not form.get('user[password]'):
+            raise web.HTTPFound('/users/sign_in')
+
+        token = secrets.token_hex(16)
+        self.sessions.add(token)
+        self.stats['logins'] += 1
+        response = web.HTTPFound('/valuebets')
+        response.set_cookie(SESSION_COOKIE, token, path='/')
+        raise response
+
+    async def handle_sign_out(self, request):
+        self.sessions.discard(request.cookies.get(SESSION_COOKIE))
+        response = web.HTTPFound('/users/sign_in')
+        response.del_cookie(SESSION_COOKIE, path='/')
+        raise response
+
+    async def handle_valuebets(self, request):
+        if not self.is_signed_in(request):
+            self.stats['redirects'] += 1
+            raise web.HTTPFound('/users/sign_in')
+        self.stats['valuebets'] += 1
+        await self.delay()
+        return web.Response(text=self.valuebets_page(), content_type='text/html')
+
+
+class ReplayServerThread:
+    """Запускает ReplaySite в отдельном потоке со своим циклом событий (для бенчмарков)."""
+    def __init__(self, site, host='127.0.0.1', port=0):
+        self.site = site
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.site.create_app())
+        self._loop.run_until_complete(self._runner.setup())
+        tcp_site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(tcp_site.start())
+        self.port = self._runner.addresses[0][1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='replay-server', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8089)
+    arg_parser.add_argument('--rows', type=int, default=100, help="строк в сгенерированной таблице")
+    arg_parser.add_argument('--churn', type=float, default=0.0, help="доля строк, заменяемых на каждом запросе")
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунд")
+    arg_parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, секунд")
+    arg_parser.add_argument('--snapshots', help="папка со снимками sign_in_*.html и valuebets_*.html")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    site = ReplaySite(rows=args.rows, churn=args.churn, latency=args.latency, jitter=args.jitter,
+                      snapshots_dir=args.snapshots, seed=args.seed)
+    try:
+        web.run_app(site.create_app(), host=args.host, port=args.port)
+    finally:
+        print(f"Запросы: {site.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import time
+
+from aiogram.enums import ChatMemberStatus
+
+
+def member_can_post(member):
+    """True if the bot's ChatMember in a channel allows posting messages."""
+    return member.status == ChatMemberStatus.ADMINISTRATOR and bool(getattr(member, 'can_post_messages', False))
+
+
+class ChannelPermissionCache:
+    """
+    Whether the bot may post in each channel, kept for ttl seconds.
+    Entries are refreshed from my_chat_member updates and dropped on send
+    errors, so in the steady state a channel send needs no extra API call.
+    """
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, channel_id):
+        """Cached permission, or None if unknown or expired."""
+        entry = self._entries.get(channel_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, channel_id, can_post):
+        self._entries[channel_id] = (can_post, time.monotonic())
+
+    def update(self, channel_id, member):
+        """Stores the permission from a ChatMember and returns it."""
+        can_post = member_can_post(member)
+        self.set(channel_id, can_post)
+        return can_post
+
+    def invalidate(self, channel_id=None):
+        if channel_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(channel_id, None)
+
+    async def can_post(self, channel_id, fetch_member):
+        """Cached permission or, on a miss, the result of await fetch_member() stored for ttl seconds."""
+        can_post = self.get(channel_id)
+        if can_post is not None:
+            self.hits += 1
+            return can_post
+        self.misses += 1
+        return self.update(channel_id, await fetch_member())
@@ -1,9 +1,22 @@
 import sqlite3
+import hashlib
 import os
+import re
+import threading
+import time
 from datetime import datetime, timedelta
 
 DB_NAME = 'bot_database.db'
 
+# Site spellings of bookmaker names, seeded into bookmaker_aliases on first run
+DEFAULT_BOOKMAKER_ALIASES = {
+    'Betboom (RU)': 'Betboom',
+    'Fonbet (RU)': 'Fonbet',
+    'Marathon (RU)': 'Marathon',
+    'Olimp (Bet)': 'Olimp',
+    'Winline (RU)': 'Winline',
+}
+
 def get_connection():
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
@@ -61,6 +74,15 @@ def create_tables():
     )
     ''')
     
+    # Bookmaker aliases table (names as shown on the site)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bookmaker_aliases (
+        alias TEXT PRIMARY KEY,
+        bookmaker_id INTEGER,
+        FOREIGN KEY (bookmaker_id) REFERENCES bookmakers (id)
+    )
+    ''')
+    
     # User bookmakers table (many-to-many relationship)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS user_bookmakers (
@@ -104,6 +126,26 @@ def create_tables():
     )
     ''')
     
+    # Delivery outbox: one row per recipient per prediction
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        prediction_key TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        text TEXT NOT NULL,
+        signal_count INTEGER,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL DEFAULT 0,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME,
+        UNIQUE (prediction_key, chat_id)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, next_attempt_at)')
+    
     # Insert default signal limits if not exists
     cursor.execute('SELECT COUNT(*) FROM signal_limits')
     if cursor.fetchone()[0] == 0:
@@ -122,8 +164,18 @@ def create_tables():
         for bookmaker in default_bookmakers:
             cursor.execute('INSERT OR IGNORE INTO bookmakers (name) VALUES (?)', (bookmaker,))
     
+    # Insert default bookmaker aliases if not exists
+    cursor.execute('SELECT COUNT(*) FROM bookmaker_aliases')
+    if cursor.fetchone()[0] == 0:
+        for alias, name in DEFAULT_BOOKMAKER_ALIASES.items():
+            cursor.execute(
+                'INSERT OR IGNORE INTO bookmaker_aliases (alias, bookmaker_id) SELECT ?, id FROM bookmakers WHERE name = ?',
+                (alias, name)
+            )
+    
     conn.commit()
     conn.close()
+    bookmaker_registry.invalidate()
 
 # User management functions
 def add_user(user_id, username, is_admin=False):
@@ -135,6 +187,7 @@ def add_user(user_id, username, is_admin=False):
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def get_user(user_id):
     conn = get_connection()
@@ -170,6 +223,7 @@ def update_subscription(user_id, days):
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def pause_subscription(user_id):
     conn = get_connection()
@@ -180,6 +234,7 @@ def pause_subscription(user_id):
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def unpause_subscription(user_id):
     conn = get_connection()
@@ -190,6 +245,7 @@ def unpause_subscription(user_id):
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def cancel_subscription(user_id):
     conn = get_connection()
@@ -200,6 +256,7 @@ def cancel_subscription(user_id):
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def make_admin(user_id):
     conn = get_connection()
@@ -231,35 +288,116 @@ def get_setting(key, default=None):
     return result[0] if result else default
 
 # Prediction tracking functions
+SENT_PREDICTIONS_TTL_DAYS = 7
+
+def _key_hash(prediction_key):
+    """Stable signed 64-bit hash of a prediction key."""
+    return int.from_bytes(hashlib.blake2b(prediction_key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+class SentPredictionCache:
+    """
+    In-memory view of sent_predictions for dedup.
+    Keys are held as 64-bit hashes with their send time, loaded once from
+    the table (last ttl_days only) on first use. Newly sent keys are kept
+    pending until flush(), which writes them in a single transaction.
+    """
+    def __init__(self, ttl_days=SENT_PREDICTIONS_TTL_DAYS):
+        self.ttl = ttl_days * 86400
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._sent_at = {}
+        self._pending = {}
+
+    def _load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT prediction_key, CAST(strftime("%s", sent_at) AS INTEGER) FROM sent_predictions '
+            'WHERE sent_at >= datetime("now", ?)',
+            (f'-{self.ttl} seconds',)
+        )
+        self._sent_at = {_key_hash(key): sent_at for key, sent_at in cursor.fetchall()}
+        conn.close()
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def load(self):
+        """(Re)reads the table; returns the number of keys still within the TTL."""
+        with self._lock:
+            self._load()
+            return len(self._sent_at)
+
+    def contains(self, prediction_key):
+        self._ensure_loaded()
+        sent_at = self._sent_at.get(_key_hash(prediction_key))
+        return sent_at is not None and time.time() - sent_at < self.ttl
+
+    def add(self, prediction_key):
+        """Marks a key as sent now; it reaches the database on the next flush()."""
+        self._ensure_loaded()
+        if self.contains(prediction_key):
+            return
+        now = int(time.time())
+        with self._lock:
+            self._sent_at[_key_hash(prediction_key)] = now
+            self._pending[prediction_key] = now
+
+    def flush(self):
+        """Writes pending keys in one transaction; returns how many were written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = get_connection()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO sent_predictions (prediction_key, sent_at) VALUES (?, datetime(?, "unixepoch"))',
+                    pending.items()
+                )
+        except sqlite3.Error:
+            # Keep them for the next flush
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+        finally:
+            conn.close()
+        return len(pending)
+
+    def prune(self):
+        """Drops keys older than the TTL from memory."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._sent_at = {key: sent_at for key, sent_at in self._sent_at.items() if sent_at >= cutoff}
+
+sent_prediction_cache = SentPredictionCache()
+
 def add_sent_prediction(prediction_key):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT OR IGNORE INTO sent_predictions (prediction_key) VALUES (?)',
-        (prediction_key,)
-    )
-    conn.commit()
-    conn.close()
+    """Buffered in sent_prediction_cache; call flush_sent_predictions() to persist."""
+    sent_prediction_cache.add(prediction_key)
+
+def flush_sent_predictions():
+    return sent_prediction_cache.flush()
 
 def is_prediction_sent(prediction_key):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT COUNT(*) FROM sent_predictions WHERE prediction_key = ?',
-        (prediction_key,)
-    )
-    result = cursor.fetchone()[0] > 0
-    conn.close()
-    return result
+    return sent_prediction_cache.contains(prediction_key)
 
 def delete_old_predictions():
+    sent_prediction_cache.flush()
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        'DELETE FROM sent_predictions WHERE sent_at < datetime("now", "-7 days")'
+        'DELETE FROM sent_predictions WHERE sent_at < datetime("now", ?)',
+        (f'-{SENT_PREDICTIONS_TTL_DAYS} days',)
     )
     conn.commit()
     conn.close()
+    sent_prediction_cache.prune()
 
 # User prediction tracking for signal limits
 def add_user_prediction(user_id, prediction_key):
@@ -356,8 +494,73 @@ def check_and_resume_users():
     )
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 # Bookmaker management functions
+class BookmakerRegistry:
+    """
+    Process-wide cache of the bookmakers table and its aliases.
+    Lookups by id, name or site alias never touch the database; the cache
+    is reloaded on first use after invalidate().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._bookmakers = []
+        self._by_id = {}
+        self._by_name = {}
+        self._by_alias = {}
+
+    def _load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM bookmakers ORDER BY name')
+        bookmakers = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('SELECT alias, bookmaker_id FROM bookmaker_aliases')
+        aliases = cursor.fetchall()
+        conn.close()
+
+        self._bookmakers = bookmakers
+        self._by_id = {bk['id']: bk for bk in bookmakers}
+        self._by_name = {bk['name']: bk for bk in bookmakers}
+        self._by_alias = {row['alias']: self._by_id[row['bookmaker_id']]
+                          for row in aliases if row['bookmaker_id'] in self._by_id}
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def all(self):
+        """All bookmakers ordered by name, as copies safe to modify."""
+        self._ensure_loaded()
+        return [dict(bk) for bk in self._bookmakers]
+
+    def get(self, bookmaker_id):
+        self._ensure_loaded()
+        return self._by_id.get(bookmaker_id)
+
+    def by_name(self, name):
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    def resolve(self, site_name):
+        """Bookmaker for a name as shown on the site: alias, exact name, then name without the (..) suffix."""
+        self._ensure_loaded()
+        bookmaker = self._by_alias.get(site_name) or self._by_name.get(site_name)
+        if bookmaker is None:
+            clean_name = re.sub(r'\s*\(.*?\)', '', site_name).strip()
+            bookmaker = self._by_alias.get(clean_name) or self._by_name.get(clean_name)
+        return bookmaker
+
+bookmaker_registry = BookmakerRegistry()
+
 def add_bookmaker(name):
     conn = get_connection()
     cursor = conn.cursor()
@@ -367,14 +570,15 @@ def add_bookmaker(name):
     )
     conn.commit()
     conn.close()
+    bookmaker_registry.invalidate()
+    routing_index.invalidate()
 
 def get_all_bookmakers():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM bookmakers ORDER BY name')
-    bookmakers = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return bookmakers
+    return bookmaker_registry.all()
+
+def get_bookmaker_id(name):
+    bookmaker = bookmaker_registry.by_name(name)
+    return bookmaker['id'] if bookmaker else None
 
 def toggle_bookmaker(bookmaker_id, is_active):
     conn = get_connection()
@@ -385,6 +589,31 @@ def toggle_bookmaker(bookmaker_id, is_active):
     )
     conn.commit()
     conn.close()
+    bookmaker_registry.invalidate()
+    routing_index.invalidate()
+
+def add_bookmaker_alias(alias, bookmaker_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT OR REPLACE INTO bookmaker_aliases (alias, bookmaker_id) VALUES (?, ?)',
+        (alias, bookmaker_id)
+    )
+    conn.commit()
+    conn.close()
+    bookmaker_registry.invalidate()
+
+def get_bookmaker_aliases():
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT a.alias, a.bookmaker_id, b.name FROM bookmaker_aliases a
+        JOIN bookmakers b ON b.id = a.bookmaker_id
+        ORDER BY b.name, a.alias
+    ''')
+    aliases = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return aliases
 
 # User bookmaker preferences
 def get_user_bookmakers(user_id):
@@ -415,6 +644,7 @@ def update_user_bookmakers(user_id, bookmaker_ids):
     
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 # Channel management functions
 def add_channel(channel_id, name):
@@ -436,6 +666,7 @@ def add_channel(channel_id, name):
     
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def get_channel(channel_id):
     conn = get_connection()
@@ -475,6 +706,7 @@ def update_channel(channel_id, is_active=None, name=None):
     
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def delete_channel(channel_id):
     conn = get_connection()
@@ -483,6 +715,7 @@ def delete_channel(channel_id):
     cursor.execute('DELETE FROM channel_bookmakers WHERE channel_id = ?', (channel_id,))
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 # Channel bookmaker preferences
 def get_channel_bookmakers(channel_id):
@@ -507,6 +740,7 @@ def update_channel_bookmaker(channel_id, bookmaker_id, is_selected):
     ''', (channel_id, bookmaker_id, is_selected))
     conn.commit()
     conn.close()
+    routing_index.invalidate()
 
 def get_selected_channel_bookmakers(channel_id=None):
     conn = get_connection()
@@ -554,4 +788,286 @@ def set_signal_limits(max_signals, pause_after, pause_hours):
         VALUES (?, ?, ?)
     ''', (max_signals, pause_after, pause_hours))
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    routing_index.invalidate()
+
+# Prediction routing
+def get_channel_bookmaker_selections():
+    """(channel_id, bookmaker_id) for every selected, active bookmaker of every channel."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT cb.channel_id, cb.bookmaker_id FROM channel_bookmakers cb
+        JOIN bookmakers b ON b.id = cb.bookmaker_id
+        WHERE cb.is_selected = TRUE AND b.is_active = TRUE
+    ''')
+    selections = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return selections
+
+def get_all_user_bookmaker_selections():
+    """(user_id, bookmaker_id) for every active bookmaker chosen by every user."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT ub.user_id, ub.bookmaker_id FROM user_bookmakers ub
+        JOIN bookmakers b ON b.id = ub.bookmaker_id
+        WHERE b.is_active = TRUE
+    ''')
+    selections = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return selections
+
+def get_daily_signal_counts():
+    """
+    user_id -> signals sent or still queued in the outbox today, for users
+    who have at least one. Queued rows already hold a claim on the limits.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT user_id, COUNT(*) FROM (
+            SELECT user_id FROM user_predictions
+            WHERE date(sent_at) = date('now')
+            UNION ALL
+            SELECT chat_id FROM outbox
+            WHERE kind = 'user' AND status IN (?, ?) AND date(created_at) = date('now')
+        )
+        GROUP BY user_id
+    ''', (OUTBOX_PENDING, OUTBOX_SENDING))
+    counts = dict(cursor.fetchall())
+    conn.close()
+    return counts
+
+class RoutingIndex:
+    """
+    Recipients of a prediction by bookmaker id, built from a few batch queries.
+    Channels and users without a bookmaker selection accept every bookmaker.
+    Daily signal counts are kept up to date in memory by claim_users(), so a
+    user drops out once the daily limit or the pause threshold is hit.
+    The index is rebuilt on first use after invalidate(), on a new day or
+    after max_age seconds.
+    """
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._built_at = 0
+        self._built_on = None
+        self.signal_limits = {}
+        self._channels_any = []
+        self._channels_by_bookmaker = {}
+        self._users_any = []
+        self._users_by_bookmaker = {}
+        self._daily_counts = {}
+        self._stopped_users = set()
+
+    def _load(self):
+        channels = [c for c in get_all_channels() if c['is_active']]
+        channel_selections = {}
+        for channel_id, bookmaker_id in get_channel_bookmaker_selections():
+            channel_selections.setdefault(channel_id, set()).add(bookmaker_id)
+        user_ids = [user['user_id'] for user in get_all_active_users()]
+        user_selections = {}
+        for user_id, bookmaker_id in get_all_user_bookmaker_selections():
+            user_selections.setdefault(user_id, set()).add(bookmaker_id)
+        self._daily_counts = get_daily_signal_counts()
+        self.signal_limits = get_signal_limits()
+
+        # Lists keep the query order: channels by name, users as stored.
+        # Unknown bookmaker ids (None included) reach only recipients without a selection.
+        self._channels_any = [c for c in channels if c['channel_id'] not in channel_selections]
+        self._users_any = [u for u in user_ids if u not in user_selections]
+        self._channels_by_bookmaker = {}
+        self._users_by_bookmaker = {}
+        for bookmaker in bookmaker_registry.all():
+            bookmaker_id = bookmaker['id']
+            self._channels_by_bookmaker[bookmaker_id] = [
+                c for c in channels
+                if c['channel_id'] not in channel_selections or bookmaker_id in channel_selections[c['channel_id']]
+            ]
+            self._users_by_bookmaker[bookmaker_id] = [
+                u for u in user_ids if u not in user_selections or bookmaker_id in user_selections[u]
+            ]
+
+        # Same limits as claim_users(): users at the pause threshold are about to be paused by the outbox worker
+        self._stopped_users = {user_id for user_id, count in self._daily_counts.items() if self._over_limits(count)}
+        self._built_at = time.time()
+        self._built_on = datetime.now().date()
+        self._loaded = True
+
+    def _is_stale(self):
+        return (not self._loaded or time.time() - self._built_at > self.max_age
+                or self._built_on != datetime.now().date())
+
+    def _ensure_loaded(self):
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def channels_for(self, bookmaker_id):
+        """Active channels that accept the bookmaker, in name order."""
+        self._ensure_loaded()
+        return self._channels_by_bookmaker.get(bookmaker_id, self._channels_any)
+
+    def _over_limits(self, count):
+        return (count >= self.signal_limits['max_signals_per_day']
+                or count >= self.signal_limits['pause_after_signals'])
+
+    def _update_stopped(self, user_id, count):
+        if self._over_limits(count):
+            self._stopped_users.add(user_id)
+        else:
+            self._stopped_users.discard(user_id)
+
+    def claim_users(self, bookmaker_id):
+        """
+        Eligible users for the bookmaker as (user_id, count after this signal).
+        Their counts go up right away so concurrent sends cannot overshoot the
+        limits; call release_user() for a send that failed.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            users = self._users_by_bookmaker.get(bookmaker_id, self._users_any)
+            claimed = []
+            for user_id in users:
+                if user_id in self._stopped_users:
+                    continue
+                count = self._daily_counts.get(user_id, 0) + 1
+                self._daily_counts[user_id] = count
+                self._update_stopped(user_id, count)
+                claimed.append((user_id, count))
+        return claimed
+
+    def release_user(self, user_id):
+        """Gives back a signal claimed by claim_users() that was not delivered."""
+        with self._lock:
+            count = max(0, self._daily_counts.get(user_id, 0) - 1)
+            self._daily_counts[user_id] = count
+            self._update_stopped(user_id, count)
+
+routing_index = RoutingIndex()
+
+# Delivery outbox
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENDING = 'sending'
+OUTBOX_SENT = 'sent'
+OUTBOX_DEAD = 'dead'
+
+def enqueue_deliveries(deliveries):
+    """
+    Queues (prediction_key, chat_id, kind, text, signal_count) rows in one
+    transaction. A recipient already queued for the same prediction is skipped.
+    Returns the skipped rows.
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM outbox')
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO outbox (prediction_key, chat_id, kind, text, signal_count) VALUES (?, ?, ?, ?, ?)',
+                deliveries
+            )
+            # Ids only grow, so the rows past last_id are exactly the ones this call added
+            cursor.execute('SELECT prediction_key, chat_id FROM outbox WHERE id > ?', (last_id,))
+            added = {(row[0], row[1]) for row in cursor.fetchall()}
+    finally:
+        conn.close()
+    skipped = []
+    for delivery in deliveries:
+        recipient = (delivery[0], delivery[1])
+        if recipient in added:
+            added.discard(recipient)
+        else:
+            skipped.append(delivery)
+    return skipped
+
+def claim_deliveries(limit):
+    """Marks up to limit due pending rows as sending, oldest first, and returns them."""
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.execute(
+                'SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?',
+                (OUTBOX_PENDING, time.time(), limit)
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+            conn.executemany(
+                'UPDATE outbox SET status = ? WHERE id = ?',
+                [(OUTBOX_SENDING, row['id']) for row in rows]
+            )
+    finally:
+        conn.close()
+    return rows
+
+def complete_delivery(delivery_id):
+    """Marks a row as sent; repeated calls for the same row change nothing."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE outbox SET status = ?, finished_at = CURRENT_TIMESTAMP, last_error = NULL '
+        'WHERE id = ? AND status = ?',
+        (OUTBOX_SENT, delivery_id, OUTBOX_SENDING)
+    )
+    conn.commit()
+    conn.close()
+
+def retry_delivery(delivery_id, error, delay):
+    """Puts a row back in the queue to be tried again after delay seconds."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ? '
+        'WHERE id = ? AND status = ?',
+        (OUTBOX_PENDING, time.time() + delay, error, delivery_id, OUTBOX_SENDING)
+    )
+    conn.commit()
+    conn.close()
+
+def dead_letter_delivery(delivery_id, error):
+    """Gives up on a row; it stays in the table with its last error."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE outbox SET status = ?, attempts = attempts + 1, finished_at = CURRENT_TIMESTAMP, last_error = ? '
+        'WHERE id = ? AND status = ?',
+        (OUTBOX_DEAD, error, delivery_id, OUTBOX_SENDING)
+    )
+    conn.commit()
+    conn.close()
+
+def reset_claimed_deliveries():
+    """Returns rows left in sending by a stop or crash to the queue; returns how many."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('UPDATE outbox SET status = ? WHERE status = ?', (OUTBOX_PENDING, OUTBOX_SENDING))
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def get_outbox_stats():
+    """status -> number of rows."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+    stats = dict(cursor.fetchall())
+    conn.close()
+    return stats
+
+def delete_old_deliveries():
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'DELETE FROM outbox WHERE status IN (?, ?) AND finished_at < datetime("now", "-7 days")',
+        (OUTBOX_SENT, OUTBOX_DEAD)
+    )
+    conn.commit()
+    conn.close()
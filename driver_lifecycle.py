@@ -0,0 +1,235 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PREFIX = 'chrome_profile_'
+
+# Части профиля, которые Chrome пересоздает сам: удаляются первыми при обрезке.
+# Default/Cache (HTTP-кэш) идет последним - ради него профиль и сохраняется.
+REGENERABLE_PROFILE_PARTS = (
+    'optimization_guide_model_store',
+    'OptimizationGuidePredictionModels',
+    'GrShaderCache',
+    'GraphiteDawnCache',
+    'ShaderCache',
+    'segmentation_platform',
+    os.path.join('Default', 'GPUCache'),
+    os.path.join('Default', 'DawnGraphiteCache'),
+    os.path.join('Default', 'DawnWebGPUCache'),
+    os.path.join('Default', 'Service Worker', 'CacheStorage'),
+    os.path.join('Default', 'Code Cache'),
+    os.path.join('Default', 'Cache'),
+)
+# Блокировки, которые упавший Chrome оставляет в профиле и из-за которых не стартует новый
+PROFILE_LOCK_FILES = ('SingletonLock', 'SingletonCookie', 'SingletonSocket')
+BROWSER_PROCESS_NAMES = ('chrome', 'chromedriver', 'chrome-headless-shell', 'google-chrome')
+
+def _process_name(process):
+    try:
+        return os.path.splitext(process.name())[0].lower()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return ''
+
+def _is_browser_process(process):
+    return _process_name(process) in BROWSER_PROCESS_NAMES
+
+def _parser_profile_arg(process, persistent_profiles=()):
+    """Профиль парсера (временный или из persistent_profiles) из командной строки Chrome или None."""
+    try:
+        cmdline = process.cmdline()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return None
+    temp_root = os.path.realpath(tempfile.gettempdir())
+    for arg in cmdline:
+        if arg.startswith('--user-data-dir='):
+            path = os.path.realpath(arg.split('=', 1)[1])
+            if os.path.dirname(path) == temp_root and os.path.basename(path).startswith(PROFILE_PREFIX):
+                return path
+            if path in persistent_profiles:
+                return path
+    return None
+
+def terminate_processes(processes, timeout=5):
+    """
+    Завершает процессы, а не завершившиеся за timeout секунд - убивает.
+    Возвращает число процессов, которых точно больше нет.
+    """
+    gone = 0
+    alive = []
+    for process in processes:
+        try:
+            process.terminate()
+            alive.append(process)
+        except psutil.NoSuchProcess:
+            gone += 1
+        except psutil.AccessDenied:
+            continue
+    terminated, alive = psutil.wait_procs(alive, timeout=timeout)
+    gone += len(terminated)
+    killed = []
+    for process in alive:
+        try:
+            process.kill()
+            killed.append(process)
+        except psutil.NoSuchProcess:
+            gone += 1
+        except psutil.AccessDenied:
+            continue
+    if killed:
+        killed, _ = psutil.wait_procs(killed, timeout=timeout)
+        gone += len(killed)
+    return gone
+
+def driver_processes(driver):
+    """Процесс chromedriver драйвера и все его потомки (Chrome, рендереры, GPU)."""
+    try:
+        pid = driver.service.process.pid
+        root = psutil.Process(pid)
+        return [root] + root.children(recursive=True)
+    except (AttributeError, psutil.NoSuchProcess, psutil.AccessDenied):
+        return []
+
+def processes_rss(processes):
+    """Суммарный RSS процессов в байтах."""
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total
+
+def cleanup_orphans(active_profiles=(), persistent_profiles=()):
+    """
+    Удаляет следы упавших запусков: процессы Chrome с временным профилем
+    парсера или с постоянным профилем из persistent_profiles, chromedriver
+    без родителя и папки chrome_profile_* во временной директории.
+    Профили из active_profiles не трогаются.
+    Возвращает (число завершенных процессов, число удаленных папок).
+    """
+    active_profiles = {os.path.realpath(path) for path in active_profiles if path}
+    persistent_profiles = {os.path.realpath(path) for path in persistent_profiles if path}
+    current_user = psutil.Process().username()
+    orphans = []
+    for process in psutil.process_iter():
+        try:
+            if not _is_browser_process(process) or process.username() != current_user:
+                continue
+            profile = _parser_profile_arg(process, persistent_profiles)
+            if profile is not None:
+                if profile not in active_profiles:
+                    orphans.append(process)
+            elif _process_name(process) == 'chromedriver':
+                parent_pid = process.ppid()
+                if parent_pid == 1 or not psutil.pid_exists(parent_pid):
+                    orphans.append(process)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+
+    killed = terminate_processes(orphans) if orphans else 0
+
+    removed = 0
+    temp_root = tempfile.gettempdir()
+    for name in os.listdir(temp_root):
+        path = os.path.realpath(os.path.join(temp_root, name))
+        if name.startswith(PROFILE_PREFIX) and path not in active_profiles and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+
+    if killed or removed:
+        logger.info(f"Очистка после прошлых запусков: завершено процессов {killed}, удалено профилей {removed}")
+    return killed, removed
+
+def directory_size(path):
+    """Размер папки в байтах (файлы, исчезнувшие во время обхода, пропускаются)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+def prepare_profile(profile_dir, max_mb=256):
+    """
+    Готовит постоянный профиль к запуску Chrome: снимает блокировки упавшего
+    браузера и, если профиль больше max_mb, удаляет восстанавливаемые части
+    (REGENERABLE_PROFILE_PARTS) по порядку, пока размер не уложится в лимит.
+    Вызывать только когда Chrome с этим профилем не запущен.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    for name in PROFILE_LOCK_FILES:
+        path = os.path.join(profile_dir, name)
+        if os.path.lexists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    limit = max_mb * 1024 * 1024
+    size = directory_size(profile_dir)
+    if size <= limit:
+        return size
+
+    logger.info(f"Профиль {profile_dir} занимает {size / (1024 * 1024):.0f} МБ, обрезка до {max_mb} МБ")
+    for part in REGENERABLE_PROFILE_PARTS:
+        path = os.path.join(profile_dir, part)
+        if not os.path.isdir(path):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        size = directory_size(profile_dir)
+        if size <= limit:
+            break
+    logger.info(f"Профиль после обрезки: {size / (1024 * 1024):.0f} МБ")
+    return size
+
+
+class DriverLifecycle:
+    """
+    Решает, когда перезапустить Chrome: после max_polls опросов или когда
+    суммарный RSS браузера превысил max_rss_mb. Перезапуск выполняется
+    между опросами, в потоке парсера.
+    """
+    def __init__(self, max_polls=200, max_rss_mb=1024):
+        self.max_polls = max_polls
+        self.max_rss_mb = max_rss_mb
+        self.polls = 0
+        self.started_at = None
+        self.recycles = 0
+
+    def driver_started(self):
+        self.polls = 0
+        self.started_at = time.time()
+
+    def poll_finished(self):
+        self.polls += 1
+
+    def recycle_reason(self, driver):
+        """Причина перезапуска или None."""
+        if driver is None:
+            return None
+        if self.max_polls and self.polls >= self.max_polls:
+            return f"{self.polls} опросов"
+        if self.max_rss_mb:
+            rss_mb = processes_rss(driver_processes(driver)) / (1024 * 1024)
+            if rss_mb >= self.max_rss_mb:
+                return f"память {rss_mb:.0f} МБ"
+        return None
+
+    def memory_report(self, driver):
+        """{'processes', 'rss_mb', 'polls', 'uptime', 'recycles'} для текущего браузера."""
+        processes = driver_processes(driver) if driver is not None else []
+        return {
+            'processes': len(processes),
+            'rss_mb': processes_rss(processes) / (1024 * 1024),
+            'polls': self.polls,
+            'uptime': time.time() - self.started_at if self.started_at and processes else 0,
+            'recycles': self.recycles,
+        }
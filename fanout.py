@@ -0,0 +1,148 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API limits: ~30 messages per second overall, about one per
+# second to the same private chat and 20 per minute to the same group or channel
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+GROUP_CHAT_RATE = 20 / 60
+
+
+class TokenBucket:
+    """
+    Rate limiter in virtual-scheduling form: acquire() reserves the next free
+    slot synchronously and sleeps once until it, so thousands of waiters do
+    not wake up and compete. burst slots may be taken back to back.
+    """
+    def __init__(self, rate, burst=1):
+        self.interval = 1 / rate
+        self.burst = burst
+        self._tat = 0.0
+
+    def reserve(self, now):
+        """Takes a slot; returns how many seconds from now it starts."""
+        start = max(now, self._tat - (self.burst - 1) * self.interval)
+        self._tat = max(self._tat, start) + self.interval
+        return start - now
+
+    def idle(self, now):
+        """True when the bucket is full again and can be dropped."""
+        return self._tat <= now
+
+    async def acquire(self):
+        delay = self.reserve(asyncio.get_running_loop().time())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FanOut:
+    """
+    Concurrent Telegram sends under the Bot API rate limits.
+
+    Every send waits for its chat's bucket (stricter for groups and channels,
+    i.e. negative chat ids) and then for the global bucket. A RetryAfter from
+    any chat pauses all sends for the requested time and the message is
+    retried. Sends to the same chat go out in the order send() was called.
+    """
+    def __init__(self, bot, global_rate=GLOBAL_RATE, private_rate=PRIVATE_CHAT_RATE, group_rate=GROUP_CHAT_RATE,
+                 max_retries=3):
+        self.bot = bot
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, burst=max(1, int(global_rate)))
+        self._chat_buckets = {}
+        self._chat_locks = {}
+        self._chat_users = {}
+        self._resume_at = 0.0
+        self.retry_after_count = 0
+
+    def _bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            now = asyncio.get_running_loop().time()
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.idle(now)}
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    async def _wait_resume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._resume_at - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Holds back every send for the given number of seconds."""
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + seconds)
+
+    async def _chat_turn(self, chat_id):
+        # asyncio.Lock wakes waiters first-in first-out, which keeps per-chat order
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._chat_users[chat_id] = self._chat_users.get(chat_id, 0) + 1
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._leave_chat(chat_id)
+            raise
+        return lock
+
+    def _leave_chat(self, chat_id):
+        users = self._chat_users[chat_id] - 1
+        if users:
+            self._chat_users[chat_id] = users
+        else:
+            del self._chat_users[chat_id]
+            del self._chat_locks[chat_id]
+
+    async def request(self, call):
+        """Runs an API call that is not a message (e.g. get_chat_member) under the global limit only."""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_resume()
+            await self._global.acquire()
+            await self._wait_resume()
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                self._retry_after(e, attempt)
+
+    def _retry_after(self, error, attempt):
+        self.retry_after_count += 1
+        self.pause(error.retry_after)
+        logger.warning(f"⏰ Telegram asked to wait {error.retry_after}s, pausing all sends")
+        if attempt >= self.max_retries:
+            raise error
+
+    async def send(self, chat_id, text, precheck=None, **kwargs):
+        """
+        Sends a message once this chat's earlier sends are done and the limits allow.
+        precheck - optional coroutine function run in the chat's turn; a falsy
+        result skips the send and None is returned.
+        """
+        lock = await self._chat_turn(chat_id)
+        try:
+            if precheck is not None and not await precheck():
+                return None
+            bucket = self._bucket(chat_id)
+            for attempt in range(self.max_retries + 1):
+                await self._wait_resume()
+                await bucket.acquire()
+                await self._global.acquire()
+                await self._wait_resume()
+                try:
+                    return await self.bot.send_message(chat_id, text, **kwargs)
+                except TelegramRetryAfter as e:
+                    self._retry_after(e, attempt)
+        finally:
+            lock.release()
+            self._leave_chat(chat_id)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import os
+from http.cookies import SimpleCookie
+
+import aiohttp
+from yarl import URL
+
+from valuebets_html import parse_valuebets_html, is_logged_in_page, row_key, RowTracker
+from prediction import Prediction
+from parser_metrics import PollMetrics
+
+logger = logging.getLogger(__name__)
+
+class SessionExpired(Exception):
+    """Сайт не принял сохраненные куки: нужен повторный вход через браузер."""
+
+
+class ValuebetsHttpClient:
+    """
+    Опрос страницы valuebets через пул соединений aiohttp с куки,
+    сохраненными парсером после входа через браузер.
+    """
+    def __init__(self, valuebets_url, cookies_file="cookies.json", user_agent=None, timeout=30, metrics_history=None):
+        self.valuebets_url = valuebets_url
+        self.cookies_file = cookies_file
+        self.user_agent = user_agent or (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+        )
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._cookies_mtime = None
+        self.row_tracker = RowTracker()
+        self.metrics_history = metrics_history
+        self.last_metrics = None
+
+    def _load_cookie_jar(self, jar):
+        """Переносит куки из cookies.json (формат Selenium) в cookie jar сессии."""
+        with open(self.cookies_file, 'r') as f:
+            cookies = json.load(f)
+
+        response_url = URL(self.valuebets_url)
+        for cookie in cookies:
+            morsel_cookie = SimpleCookie()
+            morsel_cookie[cookie['name']] = cookie['value']
+            morsel = morsel_cookie[cookie['name']]
+            morsel['path'] = cookie.get('path', '/')
+            if cookie.get('domain'):
+                morsel['domain'] = cookie['domain']
+            jar.update_cookies(morsel_cookie, response_url=response_url)
+        logger.info(f"Загружено {len(cookies)} куки для HTTP-опроса")
+
+    async def _get_session(self):
+        """Возвращает сессию, пересоздавая ее, если куки были обновлены браузером."""
+        mtime = os.path.getmtime(self.cookies_file) if os.path.exists(self.cookies_file) else None
+        if self._session is not None and not self._session.closed and mtime == self._cookies_mtime:
+            return self._session
+
+        if mtime is None:
+            raise SessionExpired("файл куки отсутствует")
+
+        await self.close()
+        # unsafe=True: иначе aiohttp не хранит куки для IP-адресов (локальная копия сайта на 127.0.0.1)
+        jar = aiohttp.CookieJar(unsafe=True)
+        self._load_cookie_jar(jar)
+        self._cookies_mtime = mtime
+        self._session = aiohttp.ClientSession(
+            cookie_jar=jar,
+            timeout=self.timeout,
+            headers={'User-Agent': self.user_agent},
+            connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=120),
+        )
+        return self._session
+
+    async def fetch_predictions(self, metrics=None):
+        """
+        Загружает страницу valuebets и возвращает прогнозы.
+        Бросает SessionExpired, если сайт перенаправил на вход.
+        """
+        metrics = metrics or PollMetrics('http')
+        session = await self._get_session()
+        with metrics.phase('http_fetch'):
+            async with session.get(self.valuebets_url) as response:
+                response.raise_for_status()
+                page_html = await response.text()
+                final_url = str(response.url)
+
+        if '/users/sign_in' in final_url or not is_logged_in_page(page_html):
+            raise SessionExpired(f"сессия недействительна ({final_url})")
+
+        def count_parse_error(error):
+            metrics.parse_errors += 1
+
+        # Разбор больших таблиц не должен занимать цикл событий
+        with metrics.phase('extraction'):
+            predictions = await asyncio.to_thread(parse_valuebets_html, page_html, count_parse_error)
+        logger.info(f"HTTP: спарсено {len(predictions)} прогнозов")
+        return predictions
+
+    async def fetch_prediction_changes(self):
+        """
+        Возвращает (новые или измененные строки, ключи исчезнувших строк) с прошлого опроса.
+        Время фаз опроса после завершения лежит в last_metrics и в metrics_history.
+        """
+        metrics = PollMetrics('http')
+        try:
+            predictions = await self.fetch_predictions(metrics)
+            changed, removed = self.row_tracker.diff(predictions)
+            metrics.rows = len(predictions)
+            metrics.changed_rows = len(changed)
+            metrics.ok = True
+            return [Prediction.from_row(row, row_key(row)) for row in changed], removed
+        finally:
+            self.last_metrics = metrics.finish(metrics.ok)
+            if self.metrics_history is not None:
+                self.metrics_history.record(metrics)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
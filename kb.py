@@ -7,6 +7,7 @@ def admin_panel_keyboard(is_parsing_active):
         [InlineKeyboardButton(text="📊 Управление БК", callback_data="bookmakers_menu")],
         [InlineKeyboardButton(text="📢 Управление каналами", callback_data="channel_settings_menu")],
         [InlineKeyboardButton(text="📈 Статус бота", callback_data="bot_status")],
+        [InlineKeyboardButton(text="⏱ Метрики парсера", callback_data="parser_metrics")],
         [InlineKeyboardButton(text="🔍 Отладка", callback_data="debug_info")],
         [InlineKeyboardButton(text=f"{'⏸️ Приостановить парсинг' if is_parsing_active else '▶️ Возобновить парсинг'}", callback_data="toggle_parsing")],
     ]
@@ -18,6 +19,7 @@ def settings_menu_keyboard():
         [InlineKeyboardButton(text="⏰ Интервал парсинга", callback_data="set_parsing_interval")],
         [InlineKeyboardButton(text="🕒 Время работы бота", callback_data="set_working_time")],
         [InlineKeyboardButton(text="🌐 Часовой пояс", callback_data="set_timezone")],
+        [InlineKeyboardButton(text="🔁 Режим получения (браузер/HTTP/push)", callback_data="toggle_fetch_mode")],
         [InlineKeyboardButton(text="📊 Лимиты сигналов", callback_data="set_signal_limits")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin_panel")]
     ]
@@ -100,6 +102,7 @@ def admin_bookmakers_management_keyboard(bookmakers):
             callback_data=f"admin_toggle_bk:{bookmaker['id']}"
         )])
     buttons.append([InlineKeyboardButton(text="➕ Добавить БК", callback_data="add_new_bk")])
+    buttons.append([InlineKeyboardButton(text="🔗 Добавить название с сайта", callback_data="add_bk_alias")])
     buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="bookmakers_menu")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -134,10 +137,9 @@ def channel_bookmakers_management_keyboard(bookmakers, selected_ids):
     # Handle case where bookmakers might be IDs instead of objects
     if bookmakers and isinstance(bookmakers[0], int):
         # Convert IDs to bookmaker objects
-        all_bookmakers = database.get_all_bookmakers()
         bookmaker_objects = []
         for bk_id in bookmakers:
-            bk_obj = next((b for b in all_bookmakers if b['id'] == bk_id), None)
+            bk_obj = database.bookmaker_registry.get(bk_id)
             if bk_obj:
                 bookmaker_objects.append(bk_obj)
         bookmakers = bookmaker_objects
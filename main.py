@@ -5,6 +5,7 @@ import sys
 import re
 import json
 import asyncio
+import aiohttp
 from datetime import datetime, timedelta
 import pytz
 import random
@@ -18,13 +19,23 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 
 import database
 import kb
-from parser import SportscheckerParser
+from parser import SportscheckerParser, DEFAULT_BASE_URL
+from parser_worker import ParserWorker
+from parser_metrics import MetricsHistory
+from parser_health import ParserHealth, OK, EMPTY, FAILED, SESSION_EXPIRED, EVENT_BROKEN, EVENT_RECOVERED, OUTCOME_TITLES
+from driver_lifecycle import cleanup_orphans
+from http_fetcher import ValuebetsHttpClient, SessionExpired
+from prediction import Prediction, set_bookmaker_resolver
+from fanout import FanOut
+from outbox import Outbox, DeliveryFailed
+from channel_permissions import ChannelPermissionCache
 
 # --- Важные настройки ---
 try:
@@ -44,6 +55,18 @@ if CHANNEL_ID:
         logger.error(f"Invalid CHANNEL_ID in config: {CHANNEL_ID}")
         CHANNEL_ID = None
 
+# A local stand-in (benchmarks/replay_server.py) can replace the live site
+SITE_URL = config.get('SITE_URL') or DEFAULT_BASE_URL
+# Directory for sign-in/valuebets page snapshots used by the replay server
+RECORD_DIR = config.get('RECORD_DIR')
+# Persistent Chrome profile so relogins reuse the HTTP cache; empty - a temp profile per launch
+CHROME_PROFILE_DIR = config.get('CHROME_PROFILE_DIR')
+CHROME_PROFILE_MAX_MB = int(config.get('CHROME_PROFILE_MAX_MB', 256))
+# How the browser reads the table: 'js', 'html', 'webdriver' or 'network' (the site's own table response)
+EXTRACTION_MODE = config.get('EXTRACTION_MODE', 'js')
+# Keep a second, cookie-authenticated Chrome ready to replace a crashed or recycled one
+STANDBY_BROWSER = bool(config.get('STANDBY_BROWSER', False))
+
 if not API_TOKEN:
     print("Ошибка: API_TOKEN не указан в config.json.")
     sys.exit(1)
@@ -57,49 +80,34 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=API_TOKEN)
+# Rate-limited concurrent sends for predictions
+fanout = FanOut(bot)
+# Whether the bot may post in each channel, so sends don't call get_chat_member every time
+channel_permissions = ChannelPermissionCache(ttl=600)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 scheduler = AsyncIOScheduler()
 sportschecker_parser = None
-
-# --- Bookmaker Name Mapping ---
-def map_bookmaker_name(parser_name):
-    """Map parser bookmaker names to database names"""
-    mapping = {
-        'Betboom': 'Betboom',
-        'Fonbet': 'Fonbet',
-        'Marathon': 'Marathon',
-        'Olimp': 'Olimp',
-        'Winline': 'Winline',
-        'Betboom (RU)': 'Betboom',
-        'Fonbet (RU)': 'Fonbet',
-        'Marathon (RU)': 'Marathon',
-        'Olimp (Bet)': 'Olimp',
-        'Winline (RU)': 'Winline',
-    }
-    if parser_name in mapping:
-        return mapping[parser_name]
-    
-    clean_name = re.sub(r'\s*\(.*?\)', '', parser_name).strip()
-    if clean_name in mapping:
-        return mapping[clean_name]
-    
-    return clean_name
-
-def _filter_and_clean_prediction(prediction_data: dict) -> dict | None:
+# Selenium runs on its own thread so polling and handlers stay responsive during a scrape
+parser_worker = ParserWorker(timeout=300)
+valuebets_http = None
+# Rolling per-phase timings of recent polls (browser and HTTP) for the admin panel
+parser_metrics_history = MetricsHistory()
+# Survives parser re-initialization so a broken login backs off instead of relaunching Chrome every cycle
+parser_health = ParserHealth()
+# 'browser' - scheduled Selenium scrape, 'http' - aiohttp polling with browser login,
+# 'push' - browser plus an in-page MutationObserver drained every PUSH_DRAIN_INTERVAL seconds
+FETCH_MODES = ('browser', 'http', 'push')
+fetch_mode = 'browser'
+PUSH_DRAIN_INTERVAL = 0.5
+PUSH_REARM_DELAY = 30
+# Serializes dedup + send between the scheduled cycle and the push drain loop
+delivery_lock = asyncio.Lock()
+
+def _filter_and_clean_prediction(prediction_data: Prediction) -> Prediction | None:
     logger.info(f"[FILTER TEST] Bypassing filter, accepting all predictions: {prediction_data}")
     return prediction_data
 
-def get_match_key(prediction_data: dict) -> str:
-    bookmaker = prediction_data.get('bookmaker', '').strip()
-    sport = prediction_data.get('sport', '').strip()
-    date = prediction_data.get('date', '').strip()
-    teams = prediction_data.get('teams', '').strip()
-    date_match = re.match(r'(\d{2}/\d{2})', date)
-    date_short = date_match.group(1) if date_match else date
-    key = f"{sport}|{date_short}|{teams}"
-    return key
-
 def is_admin(user_id):
     user = database.get_user(user_id)
     return user and user['is_admin']
@@ -121,6 +129,7 @@ class AdminStates(StatesGroup):
     waiting_for_pause_after = State()
     waiting_for_pause_hours = State()
     waiting_for_new_bk_name = State()
+    waiting_for_bk_alias = State()
     waiting_for_channel_id = State()
     waiting_for_channel_name = State()
 
@@ -142,34 +151,120 @@ async def initialize_parser():
     
     try:
         if sportschecker_parser:
-            sportschecker_parser.close()
+            await parser_worker.call(sportschecker_parser, 'close')
         
-        # Test parser connection immediately
-        test_parser = SportscheckerParser(login, password)
-        test_predictions = test_parser.get_predictions()
-        test_parser.close()
+        # Validate credentials with a real scrape and keep this instance (and its session) as the live parser
+        new_parser = SportscheckerParser(login, password, base_url=SITE_URL, record_dir=RECORD_DIR,
+                                         metrics_history=parser_metrics_history, profile_dir=CHROME_PROFILE_DIR,
+                                         health=parser_health)
+        new_parser.profile_max_mb = CHROME_PROFILE_MAX_MB
+        new_parser.extraction_mode = EXTRACTION_MODE
+        new_parser.standby_enabled = STANDBY_BROWSER
+        new_parser.lifecycle.max_polls = int(database.get_setting('driver_max_polls', 200))
+        new_parser.lifecycle.max_rss_mb = int(database.get_setting('driver_max_rss_mb', 1024))
+        try:
+            test_result = await parser_worker.call(new_parser, 'poll')
+        except (Exception, asyncio.CancelledError):
+            await parser_worker.call(new_parser, 'close')
+            raise
         
-        if test_predictions is None:
-            logger.error("❌ Parser failed to get predictions during initialization")
+        if not test_result.ok:
+            logger.error(f"❌ Parser failed to get predictions during initialization: {test_result}")
+            await parser_worker.call(new_parser, 'close')
             if ADMIN_ID:
-                await bot.send_message(ADMIN_ID, "❌ Ошибка парсера: Не удалось получить прогнозы")
+                await bot.send_message(ADMIN_ID, f"❌ Ошибка парсера: Не удалось получить прогнозы "
+                                                 f"({OUTCOME_TITLES[test_result.outcome]})")
             return False
         
-        logger.info(f"✅ Parser initialized successfully. Found {len(test_predictions) if test_predictions else 0} test predictions")
-        sportschecker_parser = SportscheckerParser(login, password)
+        logger.info(f"✅ Parser initialized successfully. Found {len(test_result.predictions)} test predictions")
+        sportschecker_parser = new_parser
         return True
         
+    except asyncio.TimeoutError:
+        logger.error("❌ Parser initialization timed out")
+        if ADMIN_ID:
+            await bot.send_message(ADMIN_ID, "❌ Ошибка парсера: превышено время ожидания при инициализации")
+        return False
     except Exception as e:
         logger.error(f"❌ Failed to initialize parser: {e}")
         if ADMIN_ID:
             await bot.send_message(ADMIN_ID, f"❌ Ошибка инициализации парсера: {str(e)}")
         return False
 
-async def send_admin_panel(chat_id):
+async def fetch_prediction_changes_over_http():
+    """Poll valuebets over aiohttp; the browser is only launched to log in again after the session expires."""
+    global valuebets_http
+    if valuebets_http is None:
+        valuebets_http = ValuebetsHttpClient(sportschecker_parser.valuebets_url, sportschecker_parser.cookies_file,
+                                             metrics_history=parser_metrics_history)
+
+    # The browser left over from validation or an earlier browser-mode poll is not needed here
+    if sportschecker_parser.driver is not None:
+        await parser_worker.call(sportschecker_parser, 'close')
+
+    try:
+        return await fetch_http_and_record()
+    except SessionExpired as e:
+        logger.warning(f"🔑 HTTP session expired ({e}), logging in with the browser...")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"❌ HTTP poll failed: {e}")
+        parser_health.record(FAILED, str(e))
+        return [], []
+
+    if not await parser_worker.call(sportschecker_parser, 'login_and_release'):
+        logger.error("❌ Browser login failed, skipping HTTP poll")
+        parser_health.record(SESSION_EXPIRED, "не удалось войти")
+        return [], []
+
+    try:
+        return await fetch_http_and_record()
+    except SessionExpired as e:
+        logger.error(f"❌ Session rejected right after login: {e}")
+        parser_health.record(SESSION_EXPIRED, str(e))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"❌ HTTP poll failed: {e}")
+        parser_health.record(FAILED, str(e))
+    return [], []
+
+async def fetch_http_and_record():
+    """One HTTP poll; a page without rows counts as EMPTY for parser_health rather than a failure."""
+    changes = await valuebets_http.fetch_prediction_changes()
+    parser_health.record(OK if valuebets_http.last_metrics.rows else EMPTY)
+    return changes
+
+async def report_parser_health():
+    """Tell the admin once when the circuit breaker opens and once when polling recovers."""
+    for event in parser_health.pop_events():
+        if event == EVENT_BROKEN:
+            logger.error(f"⛔ Parser stopped after {parser_health.failures} failures in a row")
+            text = (f"⛔ Парсер остановлен после {parser_health.failures} неудач подряд "
+                    f"({OUTCOME_TITLES.get(parser_health.last_outcome, parser_health.last_outcome)}"
+                    f"{': ' + parser_health.last_error if parser_health.last_error else ''}).\n"
+                    f"Следующая попытка через {parser_health.retry_in() / 60:.0f} мин.")
+        elif event == EVENT_RECOVERED:
+            logger.info("✅ Parser recovered")
+            text = "✅ Парсер снова работает"
+        else:
+            continue
+        if ADMIN_ID:
+            await bot.send_message(ADMIN_ID, text)
+
+async def forget_unsent_rows(keys):
+    """Make the row differ report these rows again next poll so failed sends are retried."""
+    if not keys:
+        return
+    if valuebets_http is not None and fetch_mode == 'http':
+        valuebets_http.row_tracker.forget(keys)
+    else:
+        await parser_worker.call(sportschecker_parser, 'forget_rows', keys)
+
+def is_parsing_active():
+    """True while the scrape job is scheduled; an admin pause removes it."""
     job = scheduler.get_job('send_predictions_job')
-    is_parsing_active = job is not None and not job.pending and job.next_run_time is not None
-    
-    keyboard = kb.admin_panel_keyboard(is_parsing_active)
+    return job is not None and not job.pending and job.next_run_time is not None
+
+async def send_admin_panel(chat_id):
+    keyboard = kb.admin_panel_keyboard(is_parsing_active())
     await bot.send_message(chat_id, "Добро пожаловать в админ-панель!", reply_markup=keyboard)
 
 async def send_predictions_to_subscribed_users():
@@ -178,6 +273,14 @@ async def send_predictions_to_subscribed_users():
     logger.info("🔍 Starting prediction sending process...")
     
     try:
+        # After repeated failures the parser is left alone until its back-off expires
+        if not parser_health.allow_attempt():
+            logger.info(f"⏸ Parser is {parser_health.state}, next attempt in {parser_health.retry_in():.0f}s")
+            return
+
+        # Recipients are re-read once per cycle so expired subscriptions and the daily rollover are picked up
+        database.routing_index.invalidate()
+
         # Check parser status
         if sportschecker_parser is None:
             logger.warning("⚠️ Parser not initialized, attempting to initialize...")
@@ -188,32 +291,65 @@ async def send_predictions_to_subscribed_users():
                 return
 
         logger.info("🔄 Getting predictions from parser...")
-        predictions = sportschecker_parser.get_predictions()
-        
-        if predictions is None:
-            logger.error("❌ Parser returned None instead of predictions list")
+        try:
+            # Only rows added or changed since the previous poll come back; unchanged rows skip dedup entirely
+            if fetch_mode == 'http':
+                predictions, removed_keys = await fetch_prediction_changes_over_http()
+                if predictions:
+                    await forget_unsent_rows(await deliver_predictions(predictions))
+            else:
+                # Each row is deduped and sent as soon as it is extracted instead of after the whole table
+                predictions = []
+                unsent_rows = []
+                async for prediction in parser_worker.iterate(sportschecker_parser, 'iter_predictions', True):
+                    predictions.append(prediction)
+                    unsent_rows += await deliver_predictions([prediction])
+                removed_keys = sportschecker_parser.last_removed_keys
+                # The poll has stored its row state by now, so forgetting cannot be overwritten
+                await forget_unsent_rows(unsent_rows)
+                # Between polls is the only safe moment to restart a bloated or long-lived Chrome
+                await parser_worker.call(sportschecker_parser, 'recycle_if_needed')
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Parser did not finish within {parser_worker.timeout}s, skipping this run")
             if ADMIN_ID:
-                await bot.send_message(ADMIN_ID, "❌ Парсер вернул ошибку (None)")
-            await schedule_next_run()
+                await bot.send_message(ADMIN_ID, "❌ Парсер не уложился в отведенное время")
             return
-            
-        logger.info(f"📊 Parser returned {len(predictions)} predictions")
+
+        logger.info(f"📊 Parser returned {len(predictions)} new or changed predictions, {len(removed_keys)} rows removed")
 
         if not predictions:
             logger.info("ℹ️ No new predictions found")
-            await schedule_next_run()
-            return
 
+    except Exception as e:
+        logger.error(f"💥 Critical error in prediction sending: {e}", exc_info=True)
+        if ADMIN_ID:
+            await bot.send_message(ADMIN_ID, f"💥 Критическая ошибка отправки прогнозов: {str(e)}")
+    
+    finally:
+        await report_parser_health()
+        logger.info("🔄 Scheduling next run...")
+        await schedule_next_run()
+
+async def deliver_predictions(predictions):
+    """
+    Dedup freshly scraped rows against sent_predictions and queue the new ones in the outbox.
+    Returns the row keys of new predictions that got no outbox row (no recipients or failed
+    to queue); pass them to forget_unsent_rows() once the poll is over. Filtered and already
+    sent rows stay in the row differ.
+    """
+    async with delivery_lock:
         new_predictions_to_send = []
+        unsent_rows = []
         for i, p in enumerate(predictions):
-            logger.debug(f"🔍 Processing prediction {i+1}: {p.get('teams', 'Unknown')}")
+            logger.debug(f"🔍 Processing prediction {i+1}: {p.teams or 'Unknown'}")
             
             filtered_p = _filter_and_clean_prediction(p)
             if not filtered_p:
                 logger.debug(f"❌ Prediction {i+1} filtered out")
                 continue
                 
-            key = get_match_key(filtered_p)
+            key = filtered_p.match_key
+            # In-memory lookup; sent_predictions is read once at startup
             if database.is_prediction_sent(key):
                 logger.debug(f"⏩ Prediction {i+1} already sent (key: {key})")
                 continue
@@ -223,40 +359,97 @@ async def send_predictions_to_subscribed_users():
 
         logger.info(f"📨 Ready to send {len(new_predictions_to_send)} new predictions")
 
-        if new_predictions_to_send:
-            sent_count = 0
-            for key, pred in new_predictions_to_send:
-                try:
-                    logger.info(f"📤 Sending prediction: {key}")
-                    await send_prediction_to_user_and_channel(pred)
-                    database.add_sent_prediction(key)
-                    sent_count += 1
-                    logger.info(f"✅ Successfully sent prediction {sent_count}/{len(new_predictions_to_send)}")
-                    
-                    # Small delay between sends to avoid rate limiting
-                    await asyncio.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"❌ Failed to send prediction {key}: {e}")
-                    continue
-                    
-            logger.info(f"🎯 Total sent: {sent_count} predictions")
-            
-        else:
+        if not new_predictions_to_send:
             logger.info("ℹ️ No new predictions to send after filtering")
+            return []
+
+        # One outbox row per recipient, queued in a single transaction; the outbox workers do the sending
+        deliveries = []
+        queued_keys = []
+        queued_rows = []
+        for key, pred in new_predictions_to_send:
+            rows = prediction_deliveries(pred)
+            if rows:
+                deliveries.extend(rows)
+                queued_keys.append(key)
+                queued_rows.append(pred.tracker_key)
+            else:
+                unsent_rows.append(pred.tracker_key)
 
-    except Exception as e:
-        logger.error(f"💥 Critical error in prediction sending: {e}", exc_info=True)
-        if ADMIN_ID:
-            await bot.send_message(ADMIN_ID, f"💥 Критическая ошибка отправки прогнозов: {str(e)}")
-    
-    finally:
-        logger.info("🔄 Scheduling next run...")
-        await schedule_next_run()
+        if not deliveries:
+            logger.info("ℹ️ No recipients for the new predictions")
+            return unsent_rows
 
-from aiogram import exceptions
+        try:
+            skipped = database.enqueue_deliveries(deliveries)
+        except Exception as e:
+            logger.error(f"❌ Failed to queue {len(deliveries)} deliveries: {e}")
+            for _, chat_id, kind, _, _ in deliveries:
+                if kind == 'user':
+                    database.routing_index.release_user(chat_id)
+            return unsent_rows + queued_rows
+
+        # Recipients already queued for the same prediction keep their earlier row, not a second claim
+        for _, chat_id, kind, _, _ in skipped:
+            if kind == 'user':
+                database.routing_index.release_user(chat_id)
+        queued = len(deliveries) - len(skipped)
+
+        # Queued predictions count as sent; everything in this batch goes to sent_predictions in one transaction.
+        # Predictions without recipients stay unsent so they go out once someone accepts them
+        for key in queued_keys:
+            database.add_sent_prediction(key)
+        database.flush_sent_predictions()
+        outbox.wake()
+        logger.info(f"🎯 Queued {queued} deliveries for {len(queued_keys)} predictions")
+        return unsent_rows
+
+async def push_drain_loop():
+    """In push mode, drain rows buffered by the in-page MutationObserver at sub-second cadence."""
+    armed = False
+    next_arm_attempt = 0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(PUSH_DRAIN_INTERVAL)
+        try:
+            if fetch_mode != 'push' or sportschecker_parser is None:
+                armed = False
+                continue
+            # A scheduled scrape owns the browser; drains resume once it is done
+            if parser_worker.is_busy:
+                continue
+            # Paused by the admin: nothing is delivered until parsing is resumed.
+            # The job is also briefly absent while a scrape runs; the observer stays armed
+            if not is_parsing_active():
+                continue
+
+            if not armed:
+                if loop.time() < next_arm_attempt or not parser_health.allow_attempt():
+                    continue
+                armed = await parser_worker.call(sportschecker_parser, 'start_push_mode')
+                if not armed:
+                    next_arm_attempt = loop.time() + PUSH_REARM_DELAY
+                await report_parser_health()
+                continue
 
-async def send_prediction_to_user_and_channel(prediction_data):
+            changes = await parser_worker.call(sportschecker_parser, 'drain_pushed_predictions', timeout=15)
+            if changes is None:
+                logger.warning("⚠️ Table observer lost, re-arming push mode")
+                armed = False
+                continue
+
+            predictions, _ = changes
+            if predictions:
+                logger.info(f"⚡ Push mode: {len(predictions)} new or changed rows")
+                await forget_unsent_rows(await deliver_predictions(predictions))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Push drain error: {e}")
+            armed = False
+
+def prediction_deliveries(prediction_data: Prediction):
+    """Outbox rows (prediction_key, chat_id, kind, text, signal_count) for every recipient of a prediction."""
     MONTHS_RU = ['янв.', 'фев.', 'мар.', 'апр.', 'май', 'июнь', 'июль', 'авг.', 'сен.', 'окт.', 'ноя.', 'дек.']
     
     def safe_html(s):
@@ -266,22 +459,18 @@ async def send_prediction_to_user_and_channel(prediction_data):
         return s
     
     # Format date
-    date_str = prediction_data.get('date', '').strip()
-    formatted_date = date_str
-    try:
-        dt_obj = datetime.strptime(date_str, '%d/%m %H:%M')
-        month_index = dt_obj.month - 1
-        formatted_date = f"{dt_obj.day} {MONTHS_RU[month_index]} {dt_obj.strftime('%H:%M')}"
-    except (ValueError, IndexError):
-        formatted_date = date_str
+    formatted_date = prediction_data.date
+    kickoff = prediction_data.kickoff
+    if kickoff is not None:
+        formatted_date = f"{kickoff.day} {MONTHS_RU[kickoff.month - 1]} {kickoff.strftime('%H:%M')}"
     
     # Prepare message content
-    bookmaker = safe_html(prediction_data.get('bookmaker', ''))
-    sport = safe_html(prediction_data.get('sport', ''))
-    tournament = safe_html(prediction_data.get('tournament', ''))
-    teams = safe_html(prediction_data.get('teams', ''))
-    prediction_text = safe_html(prediction_data.get('prediction', ''))
-    odd = safe_html(prediction_data.get('odd', ''))
+    bookmaker = safe_html(prediction_data.bookmaker)
+    sport = safe_html(prediction_data.sport)
+    tournament = safe_html(prediction_data.tournament)
+    teams = safe_html(prediction_data.teams)
+    prediction_text = safe_html(prediction_data.prediction)
+    odd = safe_html(prediction_data.odd_text)
     
     formatted_message = (
         f"<b>BetsLab ЦУПИС V2</b>\n\n"
@@ -294,175 +483,87 @@ async def send_prediction_to_user_and_channel(prediction_data):
         f"<b>Коэффициент:</b> <i>{odd}</i>\n"
     )
 
-    bookmaker_name = prediction_data.get('bookmaker', '').strip()
-    # CRITICAL FIX: Map the bookmaker name to match database format
-    mapped_bookmaker_name = map_bookmaker_name(bookmaker_name)
+    bookmaker_name = prediction_data.bookmaker
+    # Name mapping and id lookup were done once when the row was parsed
+    mapped_bookmaker_name = prediction_data.bookmaker_name
+    bookmaker_id = prediction_data.bookmaker_id
     
-    prediction_key = get_match_key(prediction_data)
+    prediction_key = prediction_data.match_key
     
     logger.info(f"🎯 Processing prediction for distribution: {teams}")
-    logger.info(f"📊 Bookmaker: {bookmaker_name} -> Mapped: {mapped_bookmaker_name}, Key: {prediction_key}")
+    logger.info(f"📊 Bookmaker: {bookmaker_name} -> Mapped: {mapped_bookmaker_name} (id {bookmaker_id}), Key: {prediction_key}")
 
     if not bookmaker_name:
         logger.warning("⚠️ Prediction missing bookmaker name, skipping")
-        return
-
-    # --- Send to Channels ---
-    channels = database.get_all_channels()
-    logger.info(f"📢 Found {len(channels)} channels in database")
-    
-    channel_sent = 0
-    channel_skipped = 0
-    channel_errors = 0
-
-    for channel in channels:
-        channel_id = channel['channel_id']
-        channel_name = channel['name']
-        
-        # Skip inactive channels
-        if not channel['is_active']:
-            logger.debug(f"⏭️ Channel {channel_name} ({channel_id}) is inactive, skipping")
-            channel_skipped += 1
-            continue
-            
-        # Check channel bookmaker preferences - USE MAPPED NAME
-        channel_bookmakers = database.get_channel_bookmakers(channel_id)
-        channel_bk_names = [bk['name'] for bk in channel_bookmakers if bk['is_selected']]
-        
-        if channel_bk_names and mapped_bookmaker_name not in channel_bk_names:
-            logger.debug(f"⏭️ Channel {channel_name} doesn't accept {mapped_bookmaker_name} (original: {bookmaker_name}), skipping")
-            channel_skipped += 1
-            continue
-        
-        # Send to channel with comprehensive error handling
-        try:
-            # Verify bot has proper permissions in the channel
-            try:
-                chat_member = await bot.get_chat_member(channel_id, bot.id)
-                if chat_member.status != ChatMemberStatus.ADMINISTRATOR:
-                    logger.error(f"❌ Bot is not administrator in channel {channel_name} ({channel_id})")
-                    channel_errors += 1
-                    continue
-                    
-                if not chat_member.can_post_messages:
-                    logger.error(f"❌ Bot cannot post messages in channel {channel_name} ({channel_id})")
-                    channel_errors += 1
-                    continue
-            except exceptions.ChatNotFound:
-                logger.error(f"❌ Channel {channel_name} ({channel_id}) not found")
-                database.update_channel(channel_id, is_active=False)
-                channel_errors += 1
-                continue
-            except exceptions.BotKicked:
-                logger.error(f"❌ Bot was kicked from channel {channel_name} ({channel_id})")
-                database.update_channel(channel_id, is_active=False)
-                channel_errors += 1
-                continue
+        return []
 
-            # Send the actual message
-            logger.info(f"📤 Sending to channel: {channel_name} ({channel_id})")
-            await bot.send_message(channel_id, formatted_message, parse_mode=ParseMode.HTML)
-            
-            channel_sent += 1
-            logger.info(f"✅ Successfully sent to channel: {channel_name} ({channel_id})")
-            
-        except exceptions.ChatWriteForbidden:
-            logger.error(f"❌ Bot cannot write in channel {channel_name} ({channel_id})")
-            database.update_channel(channel_id, is_active=False)
-            channel_errors += 1
-        except exceptions.RetryAfter as e:
-            logger.warning(f"⏰ Rate limited for channel {channel_name}, retry after {e.timeout}s")
-            await asyncio.sleep(e.timeout)
-            # Retry sending after rate limit
-            try:
-                await bot.send_message(channel_id, formatted_message, parse_mode=ParseMode.HTML)
-                channel_sent += 1
-                logger.info(f"✅ Successfully sent to channel after rate limit: {channel_name}")
-            except Exception as retry_error:
-                logger.error(f"❌ Failed retry for channel {channel_name}: {retry_error}")
-                channel_errors += 1
-        except Exception as e:
-            logger.error(f"❌ Failed to send to channel {channel_name} ({channel_id}): {e}")
-            channel_errors += 1
+    # Recipients come from the routing index: active channels and users that accept this bookmaker
+    routing = database.routing_index
 
-    logger.info(f"📊 Channels: {channel_sent} successful, {channel_skipped} skipped, {channel_errors} errors")
+    channels = routing.channels_for(bookmaker_id)
+    logger.info(f"📢 {len(channels)} active channels accept {mapped_bookmaker_name}")
 
-    # --- Send to Users ---
-    users = database.get_all_active_users()
-    logger.info(f"👥 Found {len(users)} active users")
-    
-    if not users:
-        logger.info("ℹ️ No active users to send to")
-        await schedule_next_run()
-        return
+    # Paused users, users over today's limit and users who don't accept this bookmaker are already excluded;
+    # claiming counts the signal up front so queued predictions cannot push a user over the limits
+    claimed_users = routing.claim_users(bookmaker_id)
+    logger.info(f"👥 {len(claimed_users)} active users accept {mapped_bookmaker_name}")
 
-    signal_limits = database.get_signal_limits()
-    max_per_day = signal_limits['max_signals_per_day']
-    pause_after = signal_limits['pause_after_signals']
-    
-    user_sent = 0
-    user_skipped = 0
-    user_errors = 0
+    deliveries = [(prediction_key, channel['channel_id'], 'channel', formatted_message, None) for channel in channels]
+    deliveries += [(prediction_key, user_id, 'user', formatted_message, count) for user_id, count in claimed_users]
+    return deliveries
 
-    for user in users:
-        user_id = user['user_id']
-        
-        # Check if user is paused
-        if database.is_user_paused(user_id):
-            logger.debug(f"⏸️ User {user_id} is paused, skipping")
-            user_skipped += 1
-            continue
-            
-        # Check daily signal limit
-        daily_count = database.get_user_daily_signal_count(user_id)
-        if daily_count >= max_per_day:
-            logger.debug(f"📊 User {user_id} reached daily limit ({daily_count}/{max_per_day}), skipping")
-            user_skipped += 1
-            continue
-        
-        # Check user's bookmaker preferences - USE MAPPED NAME
-        user_bookmakers = database.get_user_bookmakers(user_id)
-        if user_bookmakers:
-            user_bk_names = [bk['name'] for bk in user_bookmakers]
-            if mapped_bookmaker_name not in user_bk_names:
-                logger.debug(f"🎯 User {user_id} doesn't accept {mapped_bookmaker_name} (original: {bookmaker_name}), skipping")
-                user_skipped += 1
-                continue
-        
-        # Send to user
-        try:
-            logger.info(f"📤 Sending to user {user_id}")
-            await bot.send_message(user_id, formatted_message, parse_mode=ParseMode.HTML)
-            
-            database.add_user_prediction(user_id, prediction_key)
-            user_sent += 1
-            
-            new_daily_count = daily_count + 1
-            if new_daily_count >= pause_after:
-                database.set_user_pause(user_id, signal_limits['pause_duration_hours'])
-                logger.info(f"⏸️ User {user_id} paused after {new_daily_count} signals")
-                
-        except exceptions.BotBlocked:
-            logger.error(f"❌ User {user_id} blocked the bot")
-            user_errors += 1
-        except exceptions.UserDeactivated:
-            logger.error(f"❌ User {user_id} deactivated")
-            user_errors += 1
-        except Exception as e:
-            logger.error(f"❌ Failed to send to user {user_id}: {e}")
-            user_errors += 1
+async def channel_can_post(channel_id):
+    # Served from the cache; get_chat_member only runs after the TTL expires or an error dropped the entry
+    can_post = await channel_permissions.can_post(
+        channel_id, lambda: fanout.request(lambda: bot.get_chat_member(channel_id, bot.id))
+    )
+    if not can_post:
+        logger.error(f"❌ Bot is not an administrator allowed to post in channel {channel_id}")
+    return can_post
+
+async def deliver_outbox_row(row):
+    """Send one outbox row; DeliveryFailed dead-letters it, any other error is retried by the outbox."""
+    chat_id = row['chat_id']
+    is_channel = row['kind'] == 'channel'
+    try:
+        logger.info(f"📤 Sending to {row['kind']} {chat_id}: {row['prediction_key']}")
+        if is_channel:
+            message = await fanout.send(chat_id, row['text'], parse_mode=ParseMode.HTML,
+                                        precheck=lambda: channel_can_post(chat_id))
+            if message is None:
+                raise DeliveryFailed("bot cannot post in the channel")
+        else:
+            await fanout.send(chat_id, row['text'], parse_mode=ParseMode.HTML)
+    except TelegramForbiddenError as e:
+        # Kicked from the channel, blocked by the user or the user was deactivated
+        if is_channel:
+            channel_permissions.invalidate(chat_id)
+            database.update_channel(chat_id, is_active=False)
+        else:
+            # The row is dead-lettered, so the signal claimed for it does not count
+            database.routing_index.release_user(chat_id)
+        raise DeliveryFailed(str(e)) from e
+    except TelegramBadRequest as e:
+        if is_channel:
+            # Rights may have changed (e.g. "not enough rights"); check them again before the next send
+            channel_permissions.invalidate(chat_id)
+            if 'chat not found' in str(e).lower():
+                database.update_channel(chat_id, is_active=False)
+        else:
+            database.routing_index.release_user(chat_id)
+        raise DeliveryFailed(str(e)) from e
 
-    logger.info(f"📊 Users: {user_sent} sent, {user_skipped} skipped, {user_errors} errors")
+    logger.info(f"✅ Sent to {row['kind']} {chat_id}: {row['prediction_key']}")
+    if not is_channel:
+        database.add_user_prediction(chat_id, row['prediction_key'])
+        signal_limits = database.routing_index.signal_limits or database.get_signal_limits()
+        if row['signal_count'] and row['signal_count'] >= signal_limits['pause_after_signals']:
+            database.set_user_pause(chat_id, signal_limits['pause_duration_hours'])
+            logger.info(f"⏸️ User {chat_id} paused after {row['signal_count']} signals")
 
-    # --- Final Processing ---
-    # Mark prediction as sent only if it was successfully sent to at least one recipient
-    if channel_sent > 0 or user_sent > 0:
-        database.add_sent_prediction(prediction_key)
-        logger.info(f"✅ Prediction {prediction_key} marked as sent")
-    else:
-        logger.warning(f"⚠️ Prediction {prediction_key} not sent to any recipients")
+# Durable delivery queue drained in the background, so a burst never holds up the scrape cycle
+outbox = Outbox(deliver_outbox_row)
 
-    await schedule_next_run()
 
 async def schedule_next_run():
     logger.info("⏰ Scheduling next run...")
@@ -586,7 +687,10 @@ async def process_password(message: types.Message, state: FSMContext):
     database.set_setting('sportschecker_password', password)
     await message.answer("Логин и пароль успешно сохранены.")
     await state.clear()
+    # New credentials deserve an immediate attempt even if the old ones tripped the breaker
+    parser_health.reset()
     await initialize_parser()
+    await report_parser_health()
     await send_admin_panel(message.chat.id)
 
 @dp.callback_query(F.data == "set_parsing_interval")
@@ -667,6 +771,22 @@ async def process_timezone(message: types.Message, state: FSMContext):
         await message.answer("Неверный часовой пояс. Пожалуйста, введите корректный.")
         await state.set_state(AdminStates.waiting_for_timezone)
 
+@dp.callback_query(F.data == "toggle_fetch_mode")
+async def toggle_fetch_mode_handler(callback: types.CallbackQuery):
+    global fetch_mode
+    if not is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
+        return
+    fetch_mode = FETCH_MODES[(FETCH_MODES.index(fetch_mode) + 1) % len(FETCH_MODES)]
+    database.set_setting('fetch_mode', fetch_mode)
+    mode_texts = {
+        'browser': "браузер",
+        'http': "HTTP (браузер только для входа)",
+        'push': "браузер + наблюдение за таблицей (push)",
+    }
+    await callback.message.edit_text(f"Режим получения прогнозов: {mode_texts[fetch_mode]}", reply_markup=kb.settings_menu_keyboard())
+    await callback.answer()
+
 # --- Subscription management ---
 @dp.callback_query(F.data == "subscriptions_menu")
 async def subscriptions_menu_handler(callback: types.CallbackQuery):
@@ -727,20 +847,6 @@ async def process_subscription_days(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Пожалуйста, введите корректное число дней.")
 
-async def send_with_retry(chat_id, text, parse_mode=None, max_retries=3):
-    """Send message with retry logic for network errors"""
-    for attempt in range(max_retries):
-        try:
-            await bot.send_message(chat_id, text, parse_mode=parse_mode)
-            return True
-        except Exception as e:
-            logger.error(f"Attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                return False
-    return False
-
 @dp.callback_query(F.data.startswith("pause_subscription:"))
 async def pause_subscription_handler(callback: types.CallbackQuery):
     if not is_admin(callback.from_user.id):
@@ -1341,6 +1447,12 @@ async def admin_bk_management_handler(callback: types.CallbackQuery):
     for bookmaker in bookmakers:
         status = "✅ Активна" if bookmaker['is_active'] else "❌ Неактивна"
         message += f"{bookmaker['name']}: {status}\n"
+
+    aliases = database.get_bookmaker_aliases()
+    if aliases:
+        message += "\n🔗 Названия с сайта:\n"
+        for alias in aliases:
+            message += f"{alias['alias']} → {alias['name']}\n"
     
     await callback.message.edit_text(message, reply_markup=kb.admin_bookmakers_management_keyboard(bookmakers))
     await callback.answer()
@@ -1352,8 +1464,7 @@ async def admin_toggle_bk_handler(callback: types.CallbackQuery):
         return
     
     bookmaker_id = int(callback.data.split(':')[1])
-    bookmakers = database.get_all_bookmakers()
-    bookmaker = next((bk for bk in bookmakers if bk['id'] == bookmaker_id), None)
+    bookmaker = database.bookmaker_registry.get(bookmaker_id)
     
     if bookmaker:
         new_status = not bookmaker['is_active']
@@ -1389,6 +1500,38 @@ async def process_new_bk_name(message: types.Message, state: FSMContext):
     await state.clear()
     await send_admin_panel(message.chat.id)
 
+@dp.callback_query(F.data == "add_bk_alias")
+async def add_bk_alias_handler(callback: types.CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
+        return
+    
+    await callback.message.edit_text(
+        "Введите название БК, как оно написано на сайте, и БК из списка через «=».\n"
+        "Например: Fonbet (RU) = Fonbet"
+    )
+    await state.set_state(AdminStates.waiting_for_bk_alias)
+    await callback.answer()
+
+@dp.message(AdminStates.waiting_for_bk_alias)
+async def process_bk_alias(message: types.Message, state: FSMContext):
+    alias, separator, bk_name = message.text.partition('=')
+    alias, bk_name = alias.strip(), bk_name.strip()
+    if not separator or not alias or not bk_name:
+        await message.answer("Неверный формат. Пример: Fonbet (RU) = Fonbet. Попробуйте снова:")
+        return
+    
+    bookmaker_id = database.get_bookmaker_id(bk_name)
+    if bookmaker_id is None:
+        await message.answer(f"БК '{bk_name}' не найдена. Сначала добавьте ее или проверьте название:")
+        return
+    
+    # Rows parsed from now on resolve through the alias
+    database.add_bookmaker_alias(alias, bookmaker_id)
+    await message.answer(f"Название '{alias}' теперь относится к БК '{bk_name}'.")
+    await state.clear()
+    await send_admin_panel(message.chat.id)
+
 @dp.callback_query(F.data.startswith("clear_bk:"))
 async def clear_bk_handler(callback: types.CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
@@ -1501,21 +1644,40 @@ async def bot_status_handler(callback: types.CallbackQuery):
     signal_limits = database.get_signal_limits()
     
     parser_status = "✅ Инициализирован" if sportschecker_parser else "❌ Не инициализирован"
+    browser_status = "не запущен"
+    if sportschecker_parser:
+        # Runs in the parser thread so it never walks a process tree the worker is recycling;
+        # without parser= a timeout only stops waiting and does not cancel a running scrape
+        try:
+            memory = await parser_worker.submit(sportschecker_parser.browser_memory, timeout=10)
+        except asyncio.TimeoutError:
+            browser_status = "занят опросом"
+        else:
+            if memory['processes']:
+                browser_status = (f"{memory['rss_mb']:.0f} МБ, процессов {memory['processes']}, "
+                                  f"опросов {memory['polls']}, перезапусков {memory['recycles']}")
     
     channels = database.get_all_channels()
     active_channels = [c for c in channels if c['is_active']]
+    outbox_stats = database.get_outbox_stats()
     
     status_message = (
         f"**Статус бота:**\n"
         f"Логин: {login if login else '❌ Не установлен'}\n"
         f"Пароль: {'✅ Установлен' if password else '❌ Не установлен'}\n"
         f"Парсер: {parser_status}\n"
+        f"Браузер: {browser_status}\n"
+        f"Состояние парсера: {parser_health.summary()}\n"
         f"Интервал парсинга: {interval} секунд\n"
         f"Время работы: {start_time} - {end_time}\n"
         f"Часовой пояс: {timezone}\n"
         f"Всего пользователей: {total_users}\n"
         f"Активных пользователей: {active_users}\n"
         f"Каналов: {len(active_channels)}/{len(channels)} активны\n"
+        f"Кэш прав в каналах: попаданий {channel_permissions.hits}, проверок {channel_permissions.misses}\n"
+        f"Очередь отправки: ожидают {outbox_stats.get(database.OUTBOX_PENDING, 0) + outbox_stats.get(database.OUTBOX_SENDING, 0)}, "
+        f"не доставлено {outbox_stats.get(database.OUTBOX_DEAD, 0)}\n"
+        f"Ограничений Telegram (RetryAfter): {fanout.retry_after_count}\n"
         f"Лимиты: {signal_limits['max_signals_per_day']} в день, "
         f"пауза после {signal_limits['pause_after_signals']} сигналов на "
         f"{signal_limits['pause_duration_hours']} часов\n"
@@ -1523,6 +1685,19 @@ async def bot_status_handler(callback: types.CallbackQuery):
     await callback.message.edit_text(status_message, reply_markup=kb.back_to_admin_panel_keyboard(), parse_mode=ParseMode.MARKDOWN)
     await callback.answer()
 
+@dp.callback_query(F.data == "parser_metrics")
+async def parser_metrics_handler(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("У вас нет прав администратора.", show_alert=True)
+        return
+
+    await callback.message.edit_text(
+        parser_metrics_history.format_report(),
+        reply_markup=kb.back_to_admin_panel_keyboard(),
+        parse_mode=ParseMode.HTML
+    )
+    await callback.answer()
+
 @dp.callback_query(F.data == "toggle_parsing")
 async def toggle_parsing_handler(callback: types.CallbackQuery):
     if not is_admin(callback.from_user.id):
@@ -1574,6 +1749,8 @@ async def noop_handler(callback: types.CallbackQuery):
 @dp.my_chat_member(F.chat.type == "channel")
 async def my_chat_member_handler(my_chat_member: types.ChatMemberUpdated):
     new_member = my_chat_member.new_chat_member
+    # Every change of the bot's status or rights in a channel refreshes the send permission cache
+    channel_permissions.update(my_chat_member.chat.id, new_member)
     if new_member.status == ChatMemberStatus.ADMINISTRATOR:
         channel_id = my_chat_member.chat.id
         channel_title = my_chat_member.chat.title
@@ -1591,7 +1768,15 @@ async def my_chat_member_handler(my_chat_member: types.ChatMemberUpdated):
 
 # --- Startup and main ---
 async def on_startup():
+    global fetch_mode
     database.create_tables()
+    set_bookmaker_resolver(database.bookmaker_registry.resolve)
+    logger.info(f"🗂 Loaded {database.sent_prediction_cache.load()} sent prediction keys")
+    fetch_mode = database.get_setting('fetch_mode', 'browser')
+    if fetch_mode not in FETCH_MODES:
+        fetch_mode = 'browser'
+    # Chrome processes and temp profiles left behind by a crashed previous run
+    await asyncio.to_thread(cleanup_orphans, persistent_profiles=[CHROME_PROFILE_DIR])
     await initialize_parser()
     
     channels = database.get_all_channels()
@@ -1605,6 +1790,7 @@ async def on_startup():
     
     scheduler.add_job(database.delete_old_predictions, 'interval', days=2, id='delete_old_predictions_job')
     scheduler.add_job(database.delete_old_user_predictions, 'interval', days=7, id='delete_old_user_predictions_job')
+    scheduler.add_job(database.delete_old_deliveries, 'interval', days=1, id='delete_old_deliveries_job')
     scheduler.add_job(database.check_and_resume_users, 'interval', minutes=30, id='check_paused_users_job')
     await restart_scheduler()
     scheduler.start()
@@ -1612,11 +1798,23 @@ async def on_startup():
 
 async def main():
     await on_startup()
-    await dp.start_polling(bot)
+    # Picks up deliveries left unfinished by the previous run
+    outbox.start()
+    push_task = asyncio.create_task(push_drain_loop())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        push_task.cancel()
+        await outbox.stop()
+        database.flush_sent_predictions()
+        # The aiohttp session has to be closed on the loop it was created on
+        if valuebets_http:
+            await valuebets_http.close()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         logger.info("Бот остановлен.")
-        scheduler.shutdown()
\ No newline at end of file
+        scheduler.shutdown()
+        parser_worker.shutdown()
\ No newline at end of file
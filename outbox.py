@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryFailed(Exception):
+    """Raised by the deliver callback when retrying cannot help; the row is dead-lettered."""
+
+
+class Outbox:
+    """
+    Drains the outbox table with a pool of workers.
+
+    A dispatcher claims due rows in id order and hands them to the workers,
+    which call deliver(row). A row is marked sent when deliver returns,
+    dead-lettered on DeliveryFailed or after max_attempts, and otherwise
+    retried with a delay doubling from base_delay up to max_delay.
+    Rows claimed but unfinished when the bot stops are requeued by start().
+    """
+    def __init__(self, deliver, workers=16, batch_size=100, idle_interval=5, max_attempts=5, base_delay=5,
+                 max_delay=600):
+        self.deliver = deliver
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue = None
+        self._wake = None
+        self._tasks = []
+
+    def start(self):
+        requeued = database.reset_claimed_deliveries()
+        if requeued:
+            logger.info(f"📬 Requeued {requeued} deliveries interrupted by the last stop")
+        self._queue = asyncio.Queue(maxsize=self.workers * 2)
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        database.reset_claimed_deliveries()
+
+    def wake(self):
+        """Tells the dispatcher that new rows were queued."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _dispatch(self):
+        while True:
+            try:
+                self._wake.clear()
+                rows = database.claim_deliveries(self.batch_size)
+            except Exception as e:
+                logger.error(f"❌ Outbox claim failed: {e}")
+                rows = []
+            if not rows:
+                # Retries that come due are picked up on the next idle tick
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for row in rows:
+                await self._queue.put(row)
+
+    async def _work(self):
+        while True:
+            row = await self._queue.get()
+            try:
+                await self._process(row)
+            except Exception as e:
+                logger.error(f"❌ Outbox bookkeeping failed for delivery {row['id']}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, row):
+        try:
+            await self.deliver(row)
+        except DeliveryFailed as e:
+            logger.error(f"❌ Delivery {row['id']} to {row['chat_id']} dead-lettered: {e}")
+            database.dead_letter_delivery(row['id'], str(e))
+        except Exception as e:
+            attempts = row['attempts'] + 1
+            if attempts >= self.max_attempts:
+                logger.error(f"❌ Delivery {row['id']} to {row['chat_id']} failed {attempts} times, dead-lettered: {e}")
+                database.dead_letter_delivery(row['id'], str(e))
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                logger.warning(f"⚠️ Delivery {row['id']} to {row['chat_id']} failed ({e}), retry in {delay}s")
+                database.retry_delivery(row['id'], str(e), delay)
+        else:
+            database.complete_delivery(row['id'])
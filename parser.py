@@ -1,10 +1,14 @@
+import base64
 import logging
+import re
 import time
 import os
 import random
 import json
 import tempfile
 import shutil
+import threading
+from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -13,6 +17,12 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 
+from valuebets_html import PREDICTION_FIELDS, iter_valuebets_html, decode_table_response, row_key, row_fingerprint, RowTracker
+from prediction import Prediction
+from parser_metrics import PollMetrics, MetricsHistory
+from driver_lifecycle import DriverLifecycle, driver_processes, terminate_processes, prepare_profile
+from parser_health import ParserHealth, PollResult, OK, EMPTY, STALE, FAILED, SESSION_EXPIRED, BROKEN
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -24,16 +34,228 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Разбор одной строки таблицы в браузере. Повторяет логику пошагового
+# парсинга: строка без обязательного элемента возвращается как {error: ...}
+# и пропускается на стороне Python. Строки, чей ключ и хэш текста совпали
+# с known (отпечатки прошлого опроса), не разбираются и помечаются unchanged.
+ROW_EXTRACTOR_JS = """
+const ROW_SELECTOR = 'tbody.valuebet_record';
+const text = (el) => (el.innerText || '').trim();
+const required = (root, selector) => {
+    const el = root.querySelector(selector);
+    if (!el) {
+        throw new Error('no such element: ' + selector);
+    }
+    return el;
+};
+const hashText = (value) => {
+    let hash = 0;
+    for (let i = 0; i < value.length; i++) {
+        hash = (Math.imul(hash, 31) + value.charCodeAt(i)) | 0;
+    }
+    return hash;
+};
+const rowKey = (row, fingerprint) => row.dataset.id || row.id || ('h' + fingerprint);
+const extractRow = (row, known) => {
+    const fingerprint = hashText(row.textContent);
+    const recordId = row.dataset.id || row.id || '';
+    const key = rowKey(row, fingerprint);
+    if (known && known[key] === fingerprint) {
+        return {key: key, fingerprint: fingerprint, unchanged: true};
+    }
+    try {
+        let sport = '';
+        for (const span of row.querySelectorAll('span.minor')) {
+            const value = text(span);
+            if (!value.includes('(') && !value.includes(')')) {
+                sport = value;
+                break;
+            }
+        }
+        const event = required(row, 'td.event');
+        return {
+            key: key,
+            fingerprint: fingerprint,
+            bookmaker: text(required(row, 'td.booker a')),
+            sport: sport,
+            date: text(required(row, 'td.time')).replace(/\\n/g, ' '),
+            tournament: text(required(event, 'span')),
+            teams: text(required(event, 'a')),
+            prediction: text(required(row, 'td.coeff')),
+            odd: text(required(row, 'td.value')),
+            value: text(required(row, 'td span.overvalue')),
+            record_id: recordId,
+        };
+    } catch (e) {
+        return {error: String(e && e.message || e)};
+    }
+};
+"""
+
+# Извлечение строк таблицы пачкой за один запрос к WebDriver.
+# arguments[0] - отпечатки строк с прошлого опроса (или null),
+# arguments[1] и arguments[2] - номер первой строки и размер пачки.
+# Список строк снимается один раз на первой пачке и хранится в window.__vbRows,
+# следующие пачки листают этот снимок. null - снимок потерян (перезагрузка страницы).
+EXTRACT_ROWS_SCRIPT = ROW_EXTRACTOR_JS + """
+const known = arguments[0];
+const start = arguments[1];
+if (start === 0) {
+    window.__vbRows = Array.from(document.querySelectorAll('#valuebets-table > ' + ROW_SELECTOR));
+} else if (!window.__vbRows) {
+    return null;
+}
+const rows = window.__vbRows;
+const batch = rows.slice(start, start + arguments[2]);
+if (start + batch.length >= rows.length) {
+    window.__vbRows = null;
+}
+return {total: rows.length, rows: batch.map((row) => extractRow(row, known))};
+"""
+
+# Режим push: MutationObserver копит добавленные и измененные строки,
+# а также ключи удаленных. Наблюдаем за родителем таблицы, чтобы заметить
+# и полную замену #valuebets-table после фильтра.
+INSTALL_OBSERVER_SCRIPT = ROW_EXTRACTOR_JS + """
+if (window.__vbObserver) {
+    window.__vbObserver.disconnect();
+}
+window.__vbPending = new Set();
+window.__vbRemoved = [];
+const collect = (node) => {
+    const element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+    if (!element) {
+        return;
+    }
+    const row = element.closest(ROW_SELECTOR);
+    if (row) {
+        window.__vbPending.add(row);
+        return;
+    }
+    element.querySelectorAll(ROW_SELECTOR).forEach((r) => window.__vbPending.add(r));
+};
+const collectRemoved = (node) => {
+    if (node.nodeType !== Node.ELEMENT_NODE) {
+        return;
+    }
+    const rows = node.matches(ROW_SELECTOR) ? [node] : node.querySelectorAll(ROW_SELECTOR);
+    rows.forEach((r) => window.__vbRemoved.push(rowKey(r, hashText(r.textContent))));
+};
+window.__vbObserver = new MutationObserver((mutations) => {
+    for (const mutation of mutations) {
+        if (mutation.type === 'childList') {
+            mutation.addedNodes.forEach(collect);
+            mutation.removedNodes.forEach(collectRemoved);
+            // Изменения внутри строки (замена ячеек)
+            if (mutation.target.closest && mutation.target.closest(ROW_SELECTOR)) {
+                collect(mutation.target);
+            }
+        } else {
+            collect(mutation.target);
+        }
+    }
+});
+const table = document.getElementById('valuebets-table');
+const container = (table && table.parentElement) || document.body;
+window.__vbObserver.observe(container, {childList: true, subtree: true, characterData: true});
+return true;
+"""
+
+# Забирает накопленные наблюдателем строки. null - наблюдатель потерян
+# (перезагрузка страницы, выход из аккаунта) и его нужно установить заново.
+DRAIN_ROWS_SCRIPT = ROW_EXTRACTOR_JS + """
+if (!window.__vbObserver || !window.__vbPending) {
+    return null;
+}
+const known = arguments[0];
+const rows = Array.from(window.__vbPending).filter((row) => row.isConnected);
+const removed = window.__vbRemoved;
+window.__vbPending.clear();
+window.__vbRemoved = [];
+return {rows: rows.map((row) => extractRow(row, known)), removed: removed};
+"""
+
+DEFAULT_BASE_URL = "https://ru.sportschecker.net"
+
+# Ресурсы, которые не нужны для чтения таблицы: блокируются через CDP Network.setBlockedURLs
+DEFAULT_BLOCKED_URLS = (
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*.mp4', '*.webm',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*mc.yandex.ru*', '*top-fwz1.mail.ru*', '*facebook.net*', '*connect.facebook.com*',
+)
+
+CHROMEDRIVER_PATH_FILE = "chromedriver_path.json"
+
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def _read_saved_chromedriver_path():
+    """Читает путь к chromedriver, сохраненный прошлым запуском."""
+    try:
+        with open(CHROMEDRIVER_PATH_FILE, 'r') as f:
+            path = json.load(f).get('path')
+    except (OSError, ValueError, AttributeError):
+        return None
+    return path if path and os.path.exists(path) else None
+
+def resolve_chromedriver(refresh=False):
+    """
+    Возвращает путь к chromedriver.
+
+    ChromeDriverManager вызывается один раз за процесс, результат
+    сохраняется в файл и используется при следующих запусках.
+    refresh=True заново проверяет версию драйвера. Если сеть недоступна,
+    используется ранее сохраненный бинарник.
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if not refresh:
+            if _chromedriver_path and os.path.exists(_chromedriver_path):
+                return _chromedriver_path
+            saved_path = _read_saved_chromedriver_path()
+            if saved_path:
+                _chromedriver_path = saved_path
+                return saved_path
+
+        try:
+            path = ChromeDriverManager().install()
+        except Exception as e:
+            saved_path = _chromedriver_path or _read_saved_chromedriver_path()
+            if not saved_path:
+                raise
+            logger.warning(f"Не удалось обновить chromedriver, используется сохраненный: {e}")
+            _chromedriver_path = saved_path
+            return saved_path
+
+        _chromedriver_path = path
+        try:
+            with open(CHROMEDRIVER_PATH_FILE, 'w') as f:
+                json.dump({'path': path}, f)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить путь к chromedriver: {e}")
+        logger.info(f"Используется chromedriver: {path}")
+        return path
+
+class ParserCancelled(Exception):
+    """Текущая операция парсера прервана извне (таймаут или отмена)."""
+
+
 class SportscheckerParser:
     """
     Парсер для сайта Sportschecker.net с постоянной сессией и "человеческим" поведением.
     """
-    def __init__(self, login, password):
+    def __init__(self, login, password, base_url=DEFAULT_BASE_URL, record_dir=None, metrics_history=None,
+                 profile_dir=None, health=None):
         self.login = login
         self.password = password
         self.driver = None
-        self.login_url = "https://ru.sportschecker.net/users/sign_in"
-        self.valuebets_url = "https://ru.sportschecker.net/valuebets"
+        # base_url можно направить на локальную копию сайта (benchmarks/replay_server.py)
+        self.base_url = base_url.rstrip('/')
+        self.login_url = f"{self.base_url}/users/sign_in"
+        self.valuebets_url = f"{self.base_url}/valuebets"
+        # Папка для снимков страниц входа и ставок; None - не записывать
+        self.record_dir = record_dir
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
@@ -45,10 +267,62 @@ class SportscheckerParser:
         self.last_login_fail_time = 0
         self.first_session = not os.path.exists(self.cookies_file)
         self.user_data_dir = None
+        # Постоянный профиль Chrome: HTTP-кэш статики сайта переживает перезапуски.
+        # None - временный профиль на каждый запуск
+        self.profile_dir = profile_dir
+        self.profile_max_mb = 256
+        self.disk_cache_mb = 64
+        self.media_cache_mb = 16
+        # Политика загрузки страниц: 'eager' не ждет картинок и сторонних скриптов,
+        # blocked_urls - шаблоны Network.setBlockedURLs (пустой список - ничего не блокировать)
+        self.page_load_strategy = 'eager'
+        self.blocked_urls = list(DEFAULT_BLOCKED_URLS)
+        # Резервный браузер: запускается в фоне с сохраненными куки и заменяет
+        # упавший основной без запуска Chrome во время опроса
+        self.standby_enabled = False
+        self._standby = None
+        self._standby_thread = None
+        self._standby_lock = threading.Lock()
+        self._standby_closing = False
+        self._standby_failed_at = 0
+        # Способ извлечения таблицы: 'js' - один execute_script, 'html' - разбор
+        # page_source через lxml, 'webdriver' - find_element на каждое поле,
+        # 'network' - ответ сайта с данными таблицы из сетевого журнала CDP
+        # (если его нет - как 'js')
+        self.extraction_mode = 'js'
+        # URL ответа с данными таблицы для режима 'network'
+        self.table_response_pattern = re.compile(r'/valuebets')
+        self._network_events = []
+        # Строк за один execute_script: первые прогнозы уходят, пока читается остальная таблица
+        self.js_batch_size = 25
+        # Отпечатки строк прошлого опроса для get_prediction_changes
+        self.row_tracker = RowTracker()
+        self.last_removed_keys = []
+        # Время фаз текущего опроса и история последних опросов для админ-панели
+        self.metrics = PollMetrics('browser')
+        self.last_metrics = None
+        self.metrics_history = metrics_history if metrics_history is not None else MetricsHistory()
+        # Перезапуск Chrome по числу опросов и памяти
+        self.lifecycle = DriverLifecycle()
+        # Состояние по итогам опросов (паузы после неудач, остановка) и итог последнего опроса
+        self.health = health if health is not None else ParserHealth()
+        self.last_result = None
+        # Кнопка фильтра не сработала: таблица на странице может быть старой
+        self._table_stale = False
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Просит текущую операцию прерваться на ближайшей задержке."""
+        self._cancel_event.set()
+
+    def reset_cancel(self):
+        """Сбрасывает флаг отмены перед новой операцией."""
+        self._cancel_event.clear()
 
     def _random_delay(self, min_seconds=1, max_seconds=3):
-        """Создает случайную задержку."""
-        time.sleep(random.uniform(min_seconds, max_seconds))
+        """Создает случайную задержку, прерываемую через cancel()."""
+        if self._cancel_event.wait(random.uniform(min_seconds, max_seconds)):
+            raise ParserCancelled("операция парсера отменена")
 
     def _save_screenshot(self, filename="screenshot_error.png"):
         """Сохраняет скриншот в папку 'screenshots'."""
@@ -63,6 +337,20 @@ class SportscheckerParser:
         except Exception as e:
             logger.error(f"Ошибка при сохранении скриншота: {e}")
 
+    def _record_snapshot(self, kind):
+        """Сохраняет HTML текущей страницы в record_dir для последующего воспроизведения."""
+        if not self.record_dir:
+            return
+        try:
+            os.makedirs(self.record_dir, exist_ok=True)
+            filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.html"
+            path = os.path.join(self.record_dir, filename)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.driver.page_source)
+            logger.info(f"Снимок страницы сохранен: {path}")
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить снимок страницы: {e}")
+
     def _is_driver_alive(self):
         """Проверяет, жив ли еще драйвер и открыт ли браузер."""
         if not self.driver:
@@ -86,6 +374,20 @@ class SportscheckerParser:
             logger.warning("Пользователь не авторизован")
             return False
 
+    def _is_warm_session(self):
+        """Проверяет, что драйвер жив, открыта страница ставок и сессия не потеряна."""
+        if not self._is_driver_alive():
+            return False
+        try:
+            if not self.driver.current_url.startswith(self.valuebets_url):
+                return False
+            if self._check_concurrent_session_error():
+                return False
+            # Страница уже загружена, поэтому проверяем без ожидания
+            return bool(self.driver.find_elements(By.CSS_SELECTOR, 'a[href="/users/sign_out"]'))
+        except WebDriverException:
+            return False
+
     def _check_concurrent_session_error(self):
         """Проверяет наличие ошибки одновременного использования аккаунта."""
         try:
@@ -106,6 +408,37 @@ class SportscheckerParser:
         except Exception as e:
             logger.error(f"Ошибка при сохранении куки: {e}")
 
+    def _cdp_cookie(self, cookie):
+        """Куки в формате Selenium -> параметры CDP Network.setCookie."""
+        params = {
+            'name': cookie['name'],
+            'value': cookie['value'],
+            'path': cookie.get('path', '/'),
+            'secure': cookie.get('secure', False),
+            'httpOnly': cookie.get('httpOnly', False),
+        }
+        if cookie.get('domain'):
+            params['domain'] = cookie['domain']
+        else:
+            params['url'] = self.base_url
+        if 'expiry' in cookie:
+            params['expires'] = int(cookie['expiry'])
+        if cookie.get('sameSite') in ('Strict', 'Lax', 'None'):
+            params['sameSite'] = cookie['sameSite']
+        return params
+
+    def _load_cookies_cdp(self, cookies, driver=None):
+        """Ставит куки через CDP до первой навигации, без захода на страницу входа."""
+        driver = driver or self.driver
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            for cookie in cookies:
+                driver.execute_cdp_cmd('Network.setCookie', self._cdp_cookie(cookie))
+            return True
+        except WebDriverException as e:
+            logger.warning(f"Не удалось установить куки через CDP: {e}")
+            return False
+
     def _load_cookies(self):
         """Загружает куки из файла."""
         try:
@@ -113,6 +446,10 @@ class SportscheckerParser:
                 with open(self.cookies_file, 'r') as f:
                     cookies = json.load(f)
                 
+                if self._load_cookies_cdp(cookies):
+                    logger.info("Куки успешно загружены через CDP")
+                    return True
+
                 self.driver.get(self.login_url)
                 self.driver.delete_all_cookies()
                 
@@ -133,48 +470,209 @@ class SportscheckerParser:
     def _setup_driver(self):
         """Настраивает и возвращает новый драйвер Chrome."""
         try:
-            # Создаем уникальную временную директорию для профиля
-            self.user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
-            
-            options = webdriver.ChromeOptions()
-            options.add_argument(f'--user-data-dir={self.user_data_dir}')
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--disable-gpu')
-            options.add_argument('--headless')
-            options.add_argument('--window-size=1920,1080')
-            options.add_argument('--remote-debugging-port=0')
-            options.add_argument('--disable-extensions')
-            options.add_argument('--disable-plugins')
-            options.add_argument(f'--user-agent={random.choice(self.user_agents)}')
-            
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
+            if self.profile_dir:
+                # Постоянный профиль обрезается перед каждым запуском, если вырос сверх лимита
+                self.user_data_dir = os.path.abspath(self.profile_dir)
+                prepare_profile(self.user_data_dir, self.profile_max_mb)
+            else:
+                # Создаем уникальную временную директорию для профиля
+                self.user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
             
-            logger.info("Драйвер успешно запущен")
+            driver = self._launch_chrome(self.user_data_dir)
+            self.lifecycle.driver_started()
             return driver
             
         except Exception as e:
             logger.error(f"Ошибка при запуске драйвера: {e}")
-            if self.user_data_dir and os.path.exists(self.user_data_dir):
-                shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self._remove_temp_profile()
             return None
 
+    def _launch_chrome(self, user_data_dir):
+        """Запускает Chrome с профилем user_data_dir и политикой ресурсов; исключение при неудаче."""
+        options = webdriver.ChromeOptions()
+        options.add_argument(f'--user-data-dir={user_data_dir}')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--headless')
+        options.add_argument('--window-size=1920,1080')
+        options.add_argument('--remote-debugging-port=0')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-plugins')
+        # Ограничиваем кэши и отключаем загрузку моделей и обновление компонентов
+        options.add_argument(f'--disk-cache-size={self.disk_cache_mb * 1024 * 1024}')
+        options.add_argument(f'--media-cache-size={self.media_cache_mb * 1024 * 1024}')
+        options.add_argument('--disable-features=OptimizationGuideModelDownloading,OptimizationHintsFetching,'
+                             'OptimizationTargetPrediction,OptimizationHints')
+        options.add_argument('--disable-component-update')
+        options.add_argument(f'--user-agent={random.choice(self.user_agents)}')
+        options.page_load_strategy = self.page_load_strategy
+        # Журнал сетевых событий для учета запросов и трафика за опрос
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+        
+        driver_path = resolve_chromedriver()
+        try:
+            driver = webdriver.Chrome(service=Service(driver_path), options=options)
+        except WebDriverException as e:
+            # Сохраненный драйвер мог устареть после обновления Chrome
+            fresh_path = resolve_chromedriver(refresh=True)
+            if fresh_path == driver_path:
+                raise
+            logger.warning(f"Chromedriver {driver_path} не подошел, используется {fresh_path}: {e}")
+            driver = webdriver.Chrome(service=Service(fresh_path), options=options)
+        
+        logger.info("Драйвер успешно запущен")
+        self._apply_resource_policy(driver)
+        return driver
+
+    def _apply_resource_policy(self, driver):
+        """Включает блокировку ненужных ресурсов через CDP (действует до закрытия браузера)."""
+        if not self.blocked_urls:
+            return
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_urls})
+        except WebDriverException as e:
+            logger.warning(f"Не удалось включить блокировку ресурсов: {e}")
+
+    def _read_network_log(self):
+        """Забирает накопленные сетевые события CDP из журнала performance: [(method, params)]."""
+        try:
+            entries = self.driver.get_log('performance')
+        except Exception as e:
+            logger.debug(f"Журнал performance недоступен: {e}")
+            return []
+
+        events = []
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if message.get('method', '').startswith('Network.'):
+                events.append((message['method'], message.get('params', {})))
+        return events
+
+    def _account_network(self, events):
+        """Считает запросы, заблокированные запросы и полученные байты за опрос."""
+        for method, params in events:
+            if method == 'Network.requestWillBeSent':
+                self.metrics.requests += 1
+            elif method == 'Network.loadingFinished':
+                self.metrics.bytes_received += int(params.get('encodedDataLength', 0))
+            elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+                self.metrics.blocked_requests += 1
+
     def _cleanup_driver(self):
         """Очищает ресурсы драйвера."""
         if self.driver:
+            processes = driver_processes(self.driver)
             try:
                 self.driver.quit()
             except:
                 pass
             self.driver = None
+            # Зависший Chrome мог пережить quit()
+            terminate_processes([process for process in processes if process.is_running()])
         
-        if self.user_data_dir and os.path.exists(self.user_data_dir):
+        self._remove_temp_profile()
+
+    def _remove_temp_profile(self):
+        """Удаляет временный профиль; постоянный (profile_dir) остается на диске."""
+        persistent = os.path.abspath(self.profile_dir) if self.profile_dir else None
+        if self.user_data_dir and self.user_data_dir != persistent and os.path.exists(self.user_data_dir):
             try:
                 shutil.rmtree(self.user_data_dir, ignore_errors=True)
             except:
                 pass
-            self.user_data_dir = None
+        self.user_data_dir = None
+
+    def _prepare_standby(self):
+        """
+        Поток резервного браузера: запуск Chrome с временным профилем, куки
+        через CDP и проверка входа на странице ставок. Полный вход здесь не
+        выполняется, чтобы не выбить сессию основного браузера; после
+        проверки браузер ждет на about:blank.
+        """
+        user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
+        driver = None
+        try:
+            with open(self.cookies_file, 'r') as f:
+                cookies = json.load(f)
+            driver = self._launch_chrome(user_data_dir)
+            if not self._load_cookies_cdp(cookies, driver):
+                raise WebDriverException("куки не установлены")
+            driver.get(self.valuebets_url)
+            WebDriverWait(driver, 30).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href="/users/sign_out"]'))
+            )
+            driver.get('about:blank')
+        except Exception as e:
+            logger.warning(f"Резервный браузер не подготовлен: {e}")
+            self._standby_failed_at = time.time()
+            self._quit_standby(driver, user_data_dir)
+            return
+
+        with self._standby_lock:
+            if not self._standby_closing:
+                self._standby = (driver, user_data_dir)
+                driver = None
+        if driver is not None:
+            self._quit_standby(driver, user_data_dir)
+        else:
+            logger.info("Резервный браузер готов")
+
+    def _quit_standby(self, driver, user_data_dir):
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        shutil.rmtree(user_data_dir, ignore_errors=True)
+
+    def _ensure_standby(self):
+        """Запускает подготовку резервного браузера в фоне, если он включен и еще не готов."""
+        if not self.standby_enabled or self._standby is not None:
+            return
+        if self._standby_thread is not None and self._standby_thread.is_alive():
+            return
+        # После неудачи не пытаемся чаще, чем полный вход после ошибки
+        if time.time() - self._standby_failed_at < 300 or not os.path.exists(self.cookies_file):
+            return
+        self._standby_closing = False
+        self._standby_thread = threading.Thread(target=self._prepare_standby, name='parser-standby', daemon=True)
+        self._standby_thread.start()
+
+    def _promote_standby(self):
+        """Заменяет неработающий основной браузер готовым резервным. False, если резервного нет."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is None:
+            return False
+
+        driver, user_data_dir = standby
+        try:
+            _ = driver.window_handles
+        except WebDriverException:
+            logger.warning("Резервный браузер тоже недоступен")
+            self._quit_standby(driver, user_data_dir)
+            return False
+
+        self._cleanup_driver()
+        self.driver = driver
+        self.user_data_dir = user_data_dir
+        self.lifecycle.driver_started()
+        logger.info("Основной браузер заменен резервным")
+        self._ensure_standby()
+        return True
+
+    def _stop_standby(self):
+        with self._standby_lock:
+            self._standby_closing = True
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            self._quit_standby(*standby)
 
     def _perform_full_login(self):
         """Выполняет полный цикл входа."""
@@ -183,12 +681,14 @@ class SportscheckerParser:
             return False
 
         logger.info("Выполняется полный цикл входа...")
+        self.metrics.relogins += 1
         
         # Очищаем старый драйвер
         self._cleanup_driver()
         
         # Создаем новый драйвер
-        self.driver = self._setup_driver()
+        with self.metrics.phase('chrome_startup'):
+            self.driver = self._setup_driver()
         if not self.driver:
             self.last_login_fail_time = time.time()
             return False
@@ -202,6 +702,7 @@ class SportscheckerParser:
             WebDriverWait(self.driver, 30).until(
                 EC.visibility_of_element_located((By.ID, 'user_email'))
             )
+            self._record_snapshot('sign_in')
             
             # Вводим логин
             email_field = self.driver.find_element(By.ID, 'user_email')
@@ -245,16 +746,37 @@ class SportscheckerParser:
             
             return True
 
+        except ParserCancelled:
+            raise
         except Exception as e:
             logger.error(f"Ошибка во время входа: {e}")
             self._save_screenshot("login_error.png")
             self.last_login_fail_time = time.time()
             return False
 
+    def login_and_release(self):
+        """
+        Выполняет полный вход только ради свежих куки и сразу закрывает браузер.
+        Используется HTTP-режимом опроса, где Chrome нужен лишь для авторизации.
+        """
+        self.metrics = metrics = PollMetrics('login')
+        try:
+            with metrics.phase('login'), self.health.relogging():
+                metrics.ok = self._perform_full_login()
+            return metrics.ok
+        except ParserCancelled:
+            logger.warning("Вход прерван")
+            return False
+        finally:
+            self._cleanup_driver()
+            self.last_metrics = metrics.finish(metrics.ok)
+            self.metrics_history.record(metrics)
+
     def _restore_session_with_cookies(self):
         """Восстанавливает сессию с помощью куки."""
         if not self._is_driver_alive():
-            self.driver = self._setup_driver()
+            with self.metrics.phase('chrome_startup'):
+                self.driver = self._setup_driver()
             if not self.driver:
                 return False
 
@@ -275,114 +797,420 @@ class SportscheckerParser:
             else:
                 return False
                 
+        except ParserCancelled:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при восстановлении сессии: {e}")
             return False
 
-    def get_predictions(self):
-        """Основной метод для получения прогнозов."""
-        try:
-            # Управление сессией
-            if self.first_session:
-                if not self._perform_full_login():
-                    return []
+    def _iter_js_rows(self, rows):
+        """Разбирает ответ ROW_EXTRACTOR_JS: (ключ, отпечаток, прогноз или None для неизмененной строки)."""
+        for row in rows:
+            error = row.get('error')
+            if error:
+                logger.warning(f"Ошибка парсинга строки: {error}")
+                self.metrics.parse_errors += 1
+                continue
+            if row.get('unchanged'):
+                yield row['key'], row['fingerprint'], None
             else:
-                if not self._restore_session_with_cookies():
+                yield row['key'], row['fingerprint'], {key: row[key] for key in PREDICTION_FIELDS}
+
+    def _iter_rows_js(self, known_fingerprints=None):
+        """
+        Извлекает строки пачками по js_batch_size через execute_script.
+        Все пачки берутся из одного снимка списка строк, сделанного первым вызовом.
+        Строки, чьи отпечатки совпали с known_fingerprints, в браузере не разбираются.
+        """
+        start = 0
+        while True:
+            batch = self.driver.execute_script(EXTRACT_ROWS_SCRIPT, known_fingerprints, start, self.js_batch_size)
+            if batch is None:
+                raise WebDriverException("снимок строк таблицы потерян во время извлечения")
+            if start == 0 and not batch['total']:
+                logger.info("Таблица пуста")
+
+            yield from self._iter_js_rows(batch['rows'])
+
+            start += len(batch['rows'])
+            if not batch['rows'] or start >= batch['total']:
+                return
+
+    def _iter_rows_html(self):
+        """Забирает page_source одним запросом и разбирает таблицу без WebDriver."""
+        return iter_valuebets_html(self.driver.page_source, on_error=self._count_parse_error)
+
+    def _count_parse_error(self, error):
+        self.metrics.parse_errors += 1
+
+    def _iter_rows_webdriver(self):
+        """Извлекает строки таблицы через find_element (по запросу на каждое поле)."""
+        table_rows = self.driver.find_elements(By.CSS_SELECTOR, '#valuebets-table > tbody.valuebet_record')
+
+        if not table_rows:
+            logger.info("Таблица пуста")
+            return
+
+        for row in table_rows:
+            try:
+                # Парсим данные из строки
+                bookmaker_elem = row.find_element(By.CSS_SELECTOR, 'td.booker a')
+                bookmaker = bookmaker_elem.text.strip()
+
+                # Ищем спорт
+                sport = ""
+                minor_spans = row.find_elements(By.CSS_SELECTOR, 'span.minor')
+                for span in minor_spans:
+                    text = span.text.strip()
+                    if '(' not in text and ')' not in text:
+                        sport = text
+                        break
+
+                # Дата и время
+                date_elem = row.find_element(By.CSS_SELECTOR, 'td.time')
+                date = date_elem.text.strip().replace('\n', ' ')
+
+                # Команды и турнир
+                event_elem = row.find_element(By.CSS_SELECTOR, 'td.event')
+                teams = event_elem.find_element(By.TAG_NAME, 'a').text.strip()
+                tournament = event_elem.find_element(By.TAG_NAME, 'span').text.strip()
+
+                # Прогноз и коэффициенты
+                prediction_elem = row.find_element(By.CSS_SELECTOR, 'td.coeff')
+                prediction = prediction_elem.text.strip()
+
+                odd_elem = row.find_element(By.CSS_SELECTOR, 'td.value')
+                odd = odd_elem.text.strip()
+
+                value_elem = row.find_element(By.CSS_SELECTOR, 'td span.overvalue')
+                value = value_elem.text.strip()
+
+                record_id = row.get_attribute('data-id') or row.get_attribute('id') or ''
+
+                yield {
+                    'bookmaker': bookmaker,
+                    'sport': sport,
+                    'date': date,
+                    'tournament': tournament,
+                    'teams': teams,
+                    'prediction': prediction,
+                    'odd': odd,
+                    'value': value,
+                    'record_id': record_id
+                }
+
+            except Exception as e:
+                logger.warning(f"Ошибка парсинга строки: {e}")
+                self.metrics.parse_errors += 1
+                continue
+
+    def _refresh_table(self):
+        """Обеспечивает авторизованную сессию и обновляет таблицу ставок. False, если войти не удалось."""
+        # Упавший или закрытый браузер заменяется резервным: дальше хватит восстановления по куки
+        if self.standby_enabled and not self._is_driver_alive():
+            self._promote_standby()
+
+        # Управление сессией: куки и полный вход нужны только после выхода из аккаунта
+        if self._is_warm_session():
+            logger.info("Сессия активна, обновляется только таблица")
+        elif self.first_session:
+            with self.metrics.phase('login'), self.health.relogging():
+                if not self._perform_full_login():
+                    return False
+        else:
+            with self.metrics.phase('cookie_restore'):
+                restored = self._restore_session_with_cookies()
+            if not restored:
+                with self.metrics.phase('login'), self.health.relogging():
                     if not self._perform_full_login():
-                        return []
+                        return False
 
-            # Переходим на страницу со ставками
-            if self.driver.current_url != self.valuebets_url:
+        # Переходим на страницу со ставками
+        if not self.driver.current_url.startswith(self.valuebets_url):
+            with self.metrics.phase('navigation'):
                 self.driver.get(self.valuebets_url)
                 self._random_delay(3, 5)
 
-            # Обновляем таблицу
+        # Обновляем таблицу
+        self._table_stale = False
+        with self.metrics.phase('filter_click'):
             try:
                 filter_button = WebDriverWait(self.driver, 15).until(
                     EC.element_to_be_clickable((By.ID, 'ft'))
                 )
                 filter_button.click()
                 self._random_delay(3, 5)
+            except ParserCancelled:
+                raise
             except:
                 logger.warning("Не удалось нажать кнопку фильтра")
+                self._table_stale = True
 
-            # Имитируем поведение пользователя
+        # Имитируем поведение пользователя
+        with self.metrics.phase('scroll'):
             self.driver.execute_script("window.scrollTo(0, 500);")
             self._random_delay(1, 2)
             self.driver.execute_script("window.scrollTo(0, 0);")
             self._random_delay(1, 2)
 
-            # Парсим таблицу
+        with self.metrics.phase('table_wait'):
             WebDriverWait(self.driver, 20).until(
                 EC.presence_of_element_located((By.ID, 'valuebets-table'))
             )
-            
-            table_rows = self.driver.find_elements(By.CSS_SELECTOR, '#valuebets-table > tbody.valuebet_record')
-            
-            if not table_rows:
-                logger.info("Таблица пуста")
-                return []
-
-            predictions = []
-            for row in table_rows:
-                try:
-                    # Парсим данные из строки
-                    bookmaker_elem = row.find_element(By.CSS_SELECTOR, 'td.booker a')
-                    bookmaker = bookmaker_elem.text.strip()
-                    
-                    # Ищем спорт
-                    sport = ""
-                    minor_spans = row.find_elements(By.CSS_SELECTOR, 'span.minor')
-                    for span in minor_spans:
-                        text = span.text.strip()
-                        if '(' not in text and ')' not in text:
-                            sport = text
-                            break
-                    
-                    # Дата и время
-                    date_elem = row.find_element(By.CSS_SELECTOR, 'td.time')
-                    date = date_elem.text.strip().replace('\n', ' ')
-                    
-                    # Команды и турнир
-                    event_elem = row.find_element(By.CSS_SELECTOR, 'td.event')
-                    teams = event_elem.find_element(By.TAG_NAME, 'a').text.strip()
-                    tournament = event_elem.find_element(By.TAG_NAME, 'span').text.strip()
-                    
-                    # Прогноз и коэффициенты
-                    prediction_elem = row.find_element(By.CSS_SELECTOR, 'td.coeff')
-                    prediction = prediction_elem.text.strip()
-                    
-                    odd_elem = row.find_element(By.CSS_SELECTOR, 'td.value')
-                    odd = odd_elem.text.strip()
-                    
-                    value_elem = row.find_element(By.CSS_SELECTOR, 'td span.overvalue')
-                    value = value_elem.text.strip()
-
-                    predictions.append({
-                        'bookmaker': bookmaker,
-                        'sport': sport,
-                        'date': date,
-                        'tournament': tournament,
-                        'teams': teams,
-                        'prediction': prediction,
-                        'odd': odd,
-                        'value': value
-                    })
-
-                except Exception as e:
-                    logger.warning(f"Ошибка парсинга строки: {e}")
-                    continue
-            
-            logger.info(f"Спарсено {len(predictions)} прогнозов")
-            return predictions
+        self._network_events = self._read_network_log()
+        self._account_network(self._network_events)
+        self._record_snapshot('valuebets')
+        return True
+
+    def _diff_rows(self, predictions, known_fingerprints=None):
+        """Снабжает прогнозы ключом и отпечатком; неизмененные относительно known_fingerprints отдаются как None."""
+        for prediction in predictions:
+            key = row_key(prediction)
+            fingerprint = row_fingerprint(prediction)
+            if known_fingerprints is not None and known_fingerprints.get(key) == fingerprint:
+                yield key, fingerprint, None
+            else:
+                yield key, fingerprint, prediction
+
+    def _captured_table_rows(self):
+        """
+        Прогнозы из последнего ответа сайта с данными таблицы (XHR, fetch или
+        документ), найденного в сетевых событиях опроса. None, если ответа нет
+        или его формат не распознан.
+        """
+        finished = {params.get('requestId') for method, params in self._network_events
+                    if method == 'Network.loadingFinished'}
+        responses = [params for method, params in self._network_events
+                     if method == 'Network.responseReceived'
+                     and params.get('type') in ('XHR', 'Fetch', 'Document')
+                     and params.get('requestId') in finished
+                     and self.table_response_pattern.search(params.get('response', {}).get('url', ''))]
+
+        for params in reversed(responses):
+            try:
+                result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+            except WebDriverException as e:
+                logger.debug(f"Тело ответа {params['response']['url']} недоступно: {e}")
+                continue
+            body = result.get('body', '')
+            if result.get('base64Encoded'):
+                body = base64.b64decode(body).decode('utf-8', errors='replace')
+            predictions = decode_table_response(body, on_error=self._count_parse_error)
+            if predictions is not None:
+                logger.info(f"Таблица получена из ответа {params['response']['url']}: {len(predictions)} строк")
+                return predictions
+        return None
+
+    def _iter_rows(self, known_fingerprints=None):
+        """
+        Выдает (ключ, отпечаток, прогноз или None) выбранным способом извлечения.
+        Если способ отказал до первой строки, используется пошаговый парсинг.
+        """
+        if self.extraction_mode == 'network':
+            predictions = self._captured_table_rows()
+            if predictions is not None:
+                yield from self._diff_rows(predictions, known_fingerprints)
+                return
+            logger.info("Ответ с данными таблицы не найден, извлечение из DOM")
+
+        if self.extraction_mode in ('js', 'html', 'network'):
+            if self.extraction_mode != 'html':
+                rows = self._iter_rows_js(known_fingerprints)
+            else:
+                rows = self._diff_rows(self._iter_rows_html(), known_fingerprints)
+            try:
+                first = next(rows, None)
+            except Exception as e:
+                logger.warning(f"Ошибка извлечения ({self.extraction_mode}), используется пошаговый парсинг: {e}")
+            else:
+                if first is not None:
+                    yield first
+                    yield from rows
+                return
+
+        yield from self._diff_rows(self._iter_rows_webdriver(), known_fingerprints)
+
+    def iter_predictions(self, changes_only=False):
+        """
+        Генератор прогнозов (Prediction): каждая строка выдается сразу после извлечения.
 
+        С changes_only=True выдаются только строки, добавленные или измененные
+        с прошлого такого опроса; ключи исчезнувших строк после завершения
+        лежат в last_removed_keys. Прерванный или неудачный опрос не меняет
+        запомненное состояние таблицы. Время фаз и счетчики опроса после
+        завершения лежат в last_metrics и в metrics_history, исход -
+        в last_result (без прогнозов) и в health. Опрос, остановленный
+        потребителем (close генератора) или через cancel(), неудачей
+        не считается и в health и metrics_history не попадает.
+        """
+        known_fingerprints = self.row_tracker.fingerprints if changes_only else None
+        fingerprints = {}
+        count = 0
+        outcome, error = FAILED, None
+        interrupted = False
+        self.last_removed_keys = []
+        self.metrics = metrics = PollMetrics('browser')
+        try:
+            if not self._refresh_table():
+                outcome, error = SESSION_EXPIRED, "не удалось войти"
+                return
+            with metrics.phase('extraction'):
+                for key, fingerprint, prediction in self._iter_rows(known_fingerprints):
+                    fingerprints[key] = fingerprint
+                    if prediction is not None:
+                        count += 1
+                        yield Prediction.from_row(prediction, key)
+
+            metrics.ok = True
+            outcome = STALE if self._table_stale else (OK if fingerprints else EMPTY)
+            self.lifecycle.poll_finished()
+            self._ensure_standby()
+
+        except GeneratorExit:
+            # Потребитель прекратил перебор (break, остановка ParserWorker.iterate)
+            interrupted = True
+            raise
+        except ParserCancelled:
+            logger.warning("Получение прогнозов прервано")
+            interrupted = True
+            return
         except Exception as e:
             logger.error(f"Критическая ошибка: {e}")
             self._save_screenshot("critical_error.png")
-            return []
+            error = str(e)
+            return
+        finally:
+            metrics.rows = len(fingerprints)
+            metrics.changed_rows = count
+            self.last_metrics = metrics.finish(metrics.ok)
+            if interrupted:
+                self.last_result = PollResult(FAILED, error="опрос прерван")
+            else:
+                self.metrics_history.record(metrics)
+                logger.info(f"Метрики опроса: {metrics.summary()}")
+                self._record_result(outcome, error)
+
+        if changes_only:
+            self.last_removed_keys = self.row_tracker.replace(fingerprints)
+            logger.info(f"Новых или измененных строк: {count}, исчезло: {len(self.last_removed_keys)}, всего: {len(fingerprints)}")
+        else:
+            logger.info(f"Спарсено {count} прогнозов")
+
+    def _record_result(self, outcome, error=None):
+        """Сохраняет исход опроса в last_result и health; остановленный парсер закрывает браузер."""
+        self.last_result = PollResult(outcome, error=error)
+        state = self.health.record(outcome, error)
+        if outcome != OK:
+            logger.warning(f"Исход опроса: {outcome}, состояние парсера: {state}" + (f" ({error})" if error else ""))
+        if state == BROKEN and self.driver is not None:
+            logger.error("Парсер остановлен после повторных неудач, браузер закрыт")
+            self._stop_standby()
+            self._cleanup_driver()
+
+    def get_predictions(self):
+        """Основной метод для получения прогнозов."""
+        return list(self.iter_predictions())
+
+    def poll(self, changes_only=False):
+        """
+        Опрос целиком: PollResult с исходом (OK, EMPTY, STALE, FAILED,
+        SESSION_EXPIRED) и прогнозами, в отличие от get_predictions, где
+        неудача неотличима от пустой таблицы.
+        """
+        predictions = list(self.iter_predictions(changes_only))
+        result = self.last_result
+        result.predictions = predictions
+        return result
+
+    def get_prediction_changes(self):
+        """
+        Возвращает (новые или измененные строки, ключи исчезнувших строк)
+        относительно прошлого вызова. Неудачный опрос не меняет запомненное
+        состояние таблицы.
+        """
+        changed = list(self.iter_predictions(changes_only=True))
+        return changed, self.last_removed_keys
+
+    def start_push_mode(self):
+        """
+        Обновляет таблицу и устанавливает на странице MutationObserver,
+        который копит новые и измененные строки для drain_pushed_predictions.
+        """
+        try:
+            if not self._refresh_table():
+                self._record_result(SESSION_EXPIRED, "не удалось войти")
+                return False
+            self.driver.execute_script(INSTALL_OBSERVER_SCRIPT)
+            logger.info("Наблюдатель за таблицей установлен")
+            self._record_result(STALE if self._table_stale else OK)
+            return True
+        except ParserCancelled:
+            logger.warning("Установка наблюдателя прервана")
+            self._record_result(FAILED, "установка наблюдателя прервана")
+            return False
+        except Exception as e:
+            logger.error(f"Не удалось установить наблюдатель: {e}")
+            self._record_result(FAILED, str(e))
+            return False
+
+    def drain_pushed_predictions(self):
+        """
+        Забирает строки, появившиеся или изменившиеся после прошлого вызова,
+        без перезагрузки страницы. Возвращает (прогнозы, ключи исчезнувших строк)
+        или None, если наблюдатель потерян и нужен start_push_mode.
+        """
+        if not self._is_driver_alive():
+            return None
+        try:
+            result = self.driver.execute_script(DRAIN_ROWS_SCRIPT, self.row_tracker.fingerprints)
+        except WebDriverException as e:
+            logger.warning(f"Ошибка чтения буфера наблюдателя: {e}")
+            return None
+        # Журнал performance читается только при обновлении таблицы; между опросами
+        # его очищаем, чтобы он не рос и следующий опрос не разбирал устаревшие события
+        self._read_network_log()
+        if result is None:
+            return None
+
+        predictions = []
+        fingerprints = {}
+        for key, fingerprint, prediction in self._iter_js_rows(result['rows']):
+            fingerprints[key] = fingerprint
+            if prediction is not None:
+                predictions.append(Prediction.from_row(prediction, key))
+        removed = [key for key in result['removed'] if key not in fingerprints]
+        self.row_tracker.forget(removed)
+        self.row_tracker.fingerprints.update(fingerprints)
+        if predictions or removed:
+            logger.info(f"Наблюдатель: новых или измененных строк {len(predictions)}, исчезло {len(removed)}")
+        return predictions, removed
+
+    def recycle_if_needed(self):
+        """
+        Перезапускает Chrome между опросами, если он отработал lifecycle.max_polls
+        опросов или занял больше lifecycle.max_rss_mb памяти. Если готов
+        резервный браузер, он сразу становится основным; иначе новый браузер
+        поднимется на следующем опросе через куки. Возвращает причину или None.
+        """
+        reason = self.lifecycle.recycle_reason(self.driver)
+        if reason:
+            logger.info(f"Перезапуск браузера: {reason}")
+            if not self._promote_standby():
+                self._cleanup_driver()
+            self.lifecycle.recycles += 1
+        return reason
+
+    def browser_memory(self):
+        """Память и возраст текущего браузера (см. DriverLifecycle.memory_report)."""
+        return self.lifecycle.memory_report(self.driver)
+
+    def forget_rows(self, keys):
+        """Забывает строки, чтобы следующий get_prediction_changes вернул их снова."""
+        self.row_tracker.forget(keys)
 
     def close(self):
         """Закрывает парсер и очищает ресурсы."""
+        self._stop_standby()
         self._cleanup_driver()
         logger.info("Парсер закрыт")
 
@@ -399,7 +1227,7 @@ if __name__ == "__main__":
         if predictions:
             print(f"Получено {len(predictions)} прогнозов:")
             for i, pred in enumerate(predictions, 1):
-                print(f"{i}. {pred['teams']} - {pred['prediction']} ({pred['value']})")
+                print(f"{i}. {pred.teams} - {pred.prediction} ({pred.value}%)")
         else:
             print("Прогнозы не найдены")
     
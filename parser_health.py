@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Состояния парсера
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+RELOGGING = 'relogging'
+BACKED_OFF = 'backed_off'
+BROKEN = 'broken'
+
+STATE_TITLES = {
+    HEALTHY: 'работает',
+    DEGRADED: 'с ошибками',
+    RELOGGING: 'выполняется вход',
+    BACKED_OFF: 'пауза после ошибок',
+    BROKEN: 'остановлен',
+}
+
+# Исходы опроса
+OK = 'ok'
+EMPTY = 'empty'
+STALE = 'stale'
+FAILED = 'failed'
+SESSION_EXPIRED = 'session_expired'
+
+OUTCOME_TITLES = {
+    OK: 'успешно',
+    EMPTY: 'таблица пуста',
+    STALE: 'таблица не обновилась',
+    FAILED: 'ошибка',
+    SESSION_EXPIRED: 'сессия не восстановлена',
+}
+
+# События для оповещения админа (ParserHealth.pop_events)
+EVENT_BROKEN = 'broken'
+EVENT_RECOVERED = 'recovered'
+
+
+class PollResult:
+    """
+    Итог опроса. Пустая таблица (EMPTY) и неудача (FAILED, SESSION_EXPIRED)
+    различаются, хотя прогнозов в обоих случаях нет.
+    """
+    __slots__ = ('outcome', 'predictions', 'error')
+
+    def __init__(self, outcome, predictions=None, error=None):
+        self.outcome = outcome
+        self.predictions = predictions if predictions is not None else []
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.outcome in (OK, EMPTY, STALE)
+
+    def __repr__(self):
+        return f"PollResult({self.outcome!r}, predictions={len(self.predictions)}, error={self.error!r})"
+
+
+class ParserHealth:
+    """
+    Состояние парсера по итогам опросов:
+
+    healthy -> degraded после первой неудачи или устаревшей таблицы;
+    -> backed_off после повторных неудач, пауза перед следующей попыткой
+    растет вдвое от base_delay до max_delay; -> broken после break_after
+    неудач подряд: попытки не чаще раза в broken_retry секунд, админ
+    получает одно оповещение. Успешный опрос возвращает в healthy.
+    relogging - идет полный вход (после него состояние восстанавливается).
+
+    Пишется из потока парсера и цикла событий, поэтому доступ под блокировкой.
+    """
+    def __init__(self, base_delay=60, max_delay=1800, break_after=6, broken_retry=3600):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.break_after = break_after
+        self.broken_retry = broken_retry
+        self.state = HEALTHY
+        self.failures = 0
+        self.last_outcome = None
+        self.last_error = None
+        self.next_attempt_at = 0
+        self.changed_at = time.time()
+        self._resume_state = HEALTHY
+        self._events = []
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.changed_at = time.time()
+
+    def allow_attempt(self):
+        """False, пока идет пауза после неудач (backed_off или broken)."""
+        with self._lock:
+            return time.time() >= self.next_attempt_at
+
+    def retry_in(self):
+        """Секунд до следующей разрешенной попытки."""
+        with self._lock:
+            return max(0.0, self.next_attempt_at - time.time())
+
+    @contextmanager
+    def relogging(self):
+        """Состояние relogging на время полного входа."""
+        with self._lock:
+            self._resume_state = self.state
+            self._set_state(RELOGGING)
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self.state == RELOGGING:
+                    self._set_state(self._resume_state)
+
+    def record(self, outcome, error=None):
+        """Учитывает исход опроса (OK, EMPTY, STALE, FAILED, SESSION_EXPIRED) и возвращает новое состояние."""
+        now = time.time()
+        with self._lock:
+            self.last_outcome = outcome
+            self.last_error = error
+            broken = self.failures >= self.break_after
+
+            if outcome in (OK, EMPTY, STALE):
+                if broken:
+                    self._events.append(EVENT_RECOVERED)
+                self.failures = 0
+                self.next_attempt_at = 0
+                self._set_state(DEGRADED if outcome == STALE else HEALTHY)
+                return self.state
+
+            self.failures += 1
+            if self.failures >= self.break_after:
+                if not broken:
+                    self._events.append(EVENT_BROKEN)
+                self._set_state(BROKEN)
+                delay = self.broken_retry
+            elif self.failures == 1:
+                # Одна неудача - повтор в следующем цикле
+                self._set_state(DEGRADED)
+                delay = 0
+            else:
+                self._set_state(BACKED_OFF)
+                delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 2))
+            self.next_attempt_at = now + delay
+            return self.state
+
+    def reset(self):
+        """Сбрасывает неудачи (например, после смены логина и пароля)."""
+        with self._lock:
+            self.failures = 0
+            self.next_attempt_at = 0
+            self._set_state(HEALTHY)
+
+    def pop_events(self):
+        """EVENT_BROKEN и EVENT_RECOVERED с прошлого вызова; каждое событие отдается один раз."""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def summary(self):
+        """Строка для статуса бота."""
+        with self._lock:
+            text = STATE_TITLES.get(self.state, self.state)
+            if self.failures:
+                text += f", неудач подряд {self.failures}"
+            if self.last_outcome and self.last_outcome != OK:
+                text += f", последний опрос: {OUTCOME_TITLES.get(self.last_outcome, self.last_outcome)}"
+            wait = self.next_attempt_at - time.time()
+        if wait > 0:
+            text += f", повтор через {wait / 60:.0f} мин"
+        return text
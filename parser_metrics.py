@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Фазы опроса в порядке выполнения; время вложенной фазы не входит во внешнюю
+PHASES = ('chrome_startup', 'login', 'cookie_restore', 'navigation', 'filter_click', 'scroll', 'table_wait',
+          'extraction', 'http_fetch')
+
+PHASE_TITLES = {
+    'chrome_startup': 'Запуск Chrome',
+    'login': 'Вход',
+    'cookie_restore': 'Восстановление куки',
+    'navigation': 'Переход на страницу',
+    'filter_click': 'Кнопка фильтра',
+    'scroll': 'Прокрутка',
+    'table_wait': 'Ожидание таблицы',
+    'extraction': 'Извлечение строк',
+    'http_fetch': 'HTTP-запрос',
+}
+
+# Границы корзин гистограммы, секунд
+HISTOGRAM_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class PollMetrics:
+    """Время фаз и счетчики одного опроса таблицы."""
+    def __init__(self, mode):
+        self.mode = mode
+        self.started_at = datetime.now()
+        self.phases = {}
+        self.rows = 0
+        self.changed_rows = 0
+        self.parse_errors = 0
+        self.relogins = 0
+        # Сеть браузера: запросы, заблокированные политикой ресурсов, и полученные байты
+        self.requests = 0
+        self.blocked_requests = 0
+        self.bytes_received = 0
+        self.ok = False
+        self.total = 0.0
+        self._start = time.perf_counter()
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        """Замеряет фазу; пока идет вложенная фаза, время внешней не копится."""
+        now = time.perf_counter()
+        if self._stack:
+            parent, parent_start = self._stack[-1]
+            self.phases[parent] = self.phases.get(parent, 0.0) + now - parent_start
+        self._stack.append((name, now))
+        try:
+            yield
+        finally:
+            name, start = self._stack.pop()
+            now = time.perf_counter()
+            self.phases[name] = self.phases.get(name, 0.0) + now - start
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], now)
+
+    def finish(self, ok):
+        self.ok = ok
+        self.total = time.perf_counter() - self._start
+        return self
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'ok': self.ok,
+            'total': round(self.total, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'rows': self.rows,
+            'changed_rows': self.changed_rows,
+            'parse_errors': self.parse_errors,
+            'relogins': self.relogins,
+            'requests': self.requests,
+            'blocked_requests': self.blocked_requests,
+            'bytes_received': self.bytes_received,
+        }
+
+    def summary(self):
+        """Строка для лога."""
+        phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        summary = (f"{self.mode}: {self.total:.2f}s ({phases}); строк {self.rows}, изменено {self.changed_rows}, "
+                   f"ошибок разбора {self.parse_errors}, повторных входов {self.relogins}")
+        if self.requests:
+            summary += (f"; запросов {self.requests}, заблокировано {self.blocked_requests}, "
+                        f"получено {self.bytes_received / 1024:.0f} КБ")
+        return summary
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class MetricsHistory:
+    """
+    Последние опросы в памяти для админ-панели. Запись идет из потока
+    парсера, чтение - из цикла событий, поэтому доступ под блокировкой.
+    """
+    def __init__(self, maxlen=200):
+        self._polls = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self._polls.append(metrics)
+
+    def recent(self, limit=None):
+        with self._lock:
+            polls = list(self._polls)
+        return polls[-limit:] if limit else polls
+
+    def phase_stats(self):
+        """Фаза -> {count, p50, p90, max}, только по опросам, где фаза была."""
+        samples = {}
+        for metrics in self.recent():
+            for name, seconds in metrics.phases.items():
+                samples.setdefault(name, []).append(seconds)
+
+        stats = {}
+        for name in sorted(samples, key=lambda n: PHASES.index(n) if n in PHASES else len(PHASES)):
+            values = sorted(samples[name])
+            stats[name] = {
+                'count': len(values),
+                'p50': _percentile(values, 0.5),
+                'p90': _percentile(values, 0.9),
+                'max': values[-1],
+            }
+        return stats
+
+    def histogram(self, phase=None):
+        """Число опросов по корзинам HISTOGRAM_BUCKETS для фазы или для всего опроса."""
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for metrics in self.recent():
+            seconds = metrics.total if phase is None else metrics.phases.get(phase)
+            if seconds is None:
+                continue
+            index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS) if seconds <= bound), len(HISTOGRAM_BUCKETS))
+            counts[index] += 1
+        return counts
+
+    def format_report(self):
+        """Текст для админ-панели (HTML)."""
+        polls = self.recent()
+        if not polls:
+            return "<b>Метрики парсера</b>\n\nОпросов пока не было."
+
+        failed = sum(1 for metrics in polls if not metrics.ok)
+        lines = [
+            "<b>Метрики парсера</b>",
+            f"Опросов: {len(polls)} (неудачных {failed})",
+            f"Строк: {sum(m.rows for m in polls)}, изменено {sum(m.changed_rows for m in polls)}, "
+            f"ошибок разбора {sum(m.parse_errors for m in polls)}, повторных входов {sum(m.relogins for m in polls)}",
+            "",
+            "<b>Фазы (p50 / p90 / макс, с):</b>",
+        ]
+        for name, stats in self.phase_stats().items():
+            lines.append(f"{PHASE_TITLES.get(name, name)}: {stats['p50']:.2f} / {stats['p90']:.2f} / "
+                         f"{stats['max']:.2f} ({stats['count']})")
+
+        network_polls = [m for m in polls if m.requests]
+        if network_polls:
+            count = len(network_polls)
+            lines += ["", f"<b>Сеть браузера (в среднем за опрос):</b> запросов "
+                          f"{sum(m.requests for m in network_polls) / count:.0f}, заблокировано "
+                          f"{sum(m.blocked_requests for m in network_polls) / count:.0f}, получено "
+                          f"{sum(m.bytes_received for m in network_polls) / count / 1024:.0f} КБ"]
+
+        bounds = [f"≤{bound:g}" for bound in HISTOGRAM_BUCKETS] + [f">{HISTOGRAM_BUCKETS[-1]:g}"]
+        histogram = ', '.join(f"{bound}: {count}" for bound, count in zip(bounds, self.histogram()) if count)
+        lines += ["", f"<b>Длительность опроса, с:</b> {histogram}"]
+
+        last = polls[-1]
+        lines += ["", f"<b>Последний опрос</b> ({last.started_at:%H:%M:%S}): {last.total:.2f}s, "
+                      f"{'успешно' if last.ok else 'ошибка'}"]
+        return '\n'.join(lines)
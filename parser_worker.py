@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ParserWorker:
+    """
+    Выполняет блокирующие вызовы SportscheckerParser в отдельном потоке,
+    чтобы Selenium не останавливал цикл событий aiogram.
+
+    Все вызовы идут через один поток: драйвер Chrome не потокобезопасен,
+    поэтому операции парсера выполняются строго по очереди.
+    """
+    def __init__(self, timeout=300):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='parser-worker')
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def is_busy(self):
+        """Есть ли выполняющиеся или ожидающие вызовы."""
+        return self._in_flight > 0
+
+    def _start(self, job):
+        """
+        Ставит job в очередь потока парсера. Вызов считается занятым, пока
+        поток его не закончит: после таймаута или отмены корутины операция
+        еще выполняется до ближайшей проверки cancel().
+        """
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(job)
+        except BaseException:
+            self._job_done(None)
+            raise
+        future.add_done_callback(self._job_done)
+        return asyncio.wrap_future(future)
+
+    def _job_done(self, future):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    async def submit(self, func, *args, timeout=None, parser=None):
+        """
+        Запускает func(*args) в потоке парсера и ждет результат.
+        При таймауте или отмене корутины парсер получает сигнал cancel(),
+        и операция прерывается на ближайшей задержке.
+        """
+        def job():
+            if parser is not None:
+                parser.reset_cancel()
+            return func(*args)
+
+        future = self._start(job)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            logger.warning(f"Операция парсера {getattr(func, '__name__', func)} прервана")
+            if parser is not None:
+                parser.cancel()
+            raise
+
+    async def call(self, parser, method_name, *args, timeout=None):
+        """Вызывает метод парсера в потоке парсера."""
+        return await self.submit(getattr(parser, method_name), *args, timeout=timeout, parser=parser)
+
+    async def iterate(self, parser, method_name, *args, timeout=None):
+        """
+        Асинхронно перебирает генератор метода парсера, выполняемый в потоке парсера.
+
+        Элементы передаются в цикл событий по мере готовности, поэтому
+        обработка первых прогнозов начинается до конца разбора таблицы.
+        timeout ограничивает ожидание каждого следующего элемента. Если
+        перебор прерван (таймаут, отмена или break), генератор закрывается
+        в потоке парсера.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def job():
+            parser.reset_cancel()
+            generator = getattr(parser, method_name)(*args)
+            try:
+                for item in generator:
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+                    if stop.is_set():
+                        break
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+                return
+            finally:
+                generator.close()
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+        finished = False
+        future = self._start(job)
+        try:
+            while True:
+                item, error = await asyncio.wait_for(queue.get(), timeout or self.timeout)
+                if item is done:
+                    finished = True
+                    await future
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            logger.warning(f"Операция парсера {method_name} прервана")
+            raise
+        finally:
+            if not finished:
+                stop.set()
+                parser.cancel()
+
+    def shutdown(self):
+        """Останавливает поток, не дожидаясь текущей операции."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
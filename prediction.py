@@ -0,0 +1,129 @@
+import re
+import sys
+from datetime import datetime
+
+DATE_FORMAT = '%d/%m %H:%M'
+DATE_SHORT_RE = re.compile(r'(\d{2}/\d{2})')
+PARENTHESES_RE = re.compile(r'\s*\(.*?\)')
+
+# Функция "название с сайта -> запись букмекера из базы или None"; задается ботом при запуске
+_bookmaker_resolver = None
+
+def set_bookmaker_resolver(resolver):
+    """Задает функцию, по которой прогнозы получают букмекера из базы при разборе."""
+    global _bookmaker_resolver
+    _bookmaker_resolver = resolver
+
+def map_bookmaker_name(parser_name):
+    """Название букмекера без уточнения в скобках, если он не найден в базе."""
+    return PARENTHESES_RE.sub('', parser_name).strip()
+
+def make_match_key(sport, date, teams):
+    """Ключ матча для sent_predictions: спорт, день и команды."""
+    date_match = DATE_SHORT_RE.match(date)
+    date_short = date_match.group(1) if date_match else date
+    return f"{sport}|{date_short}|{teams}"
+
+def parse_kickoff(date, now=None):
+    """
+    Время начала из строки вида '25/12 18:30'. Год на сайте не указан:
+    берется текущий, а даты больше чем на полгода в прошлом относятся к следующему году.
+    """
+    try:
+        parsed = datetime.strptime(date, DATE_FORMAT)
+    except ValueError:
+        return None
+    now = now or datetime.now()
+    try:
+        kickoff = parsed.replace(year=now.year)
+        if (now - kickoff).days > 182:
+            kickoff = parsed.replace(year=now.year + 1)
+    except ValueError:
+        # 29 февраля в невисокосном году
+        return None
+    return kickoff
+
+def parse_number(text):
+    """Число из ячейки коэффициента или перевеса ('2.15', '5.3%'); None, если это не число."""
+    try:
+        return float(text.replace('%', '').replace(',', '.').strip())
+    except ValueError:
+        return None
+
+
+class Prediction:
+    """
+    Строка таблицы valuebets, разобранная один раз при парсинге.
+
+    Поддерживает чтение полей как у словаря (prediction['teams'],
+    prediction.get('odd')), чтобы row_key и отпечатки строк работали без изменений.
+    odd - число для фильтров и сортировки, odd_text - коэффициент в том виде,
+    в каком он указан на сайте, для сообщений. tracker_key - ключ строки, под
+    которым ее запомнил RowTracker парсера (по нему строку забывают).
+    """
+    __slots__ = ('bookmaker', 'sport', 'date', 'tournament', 'teams', 'prediction', 'odd', 'value',
+                 'record_id', 'kickoff', 'bookmaker_name', 'bookmaker_id', 'match_key', 'odd_text', 'tracker_key')
+
+    def __init__(self, bookmaker, sport, date, tournament, teams, prediction, odd, value, record_id='', kickoff=None,
+                 bookmaker_name=None, bookmaker_id=None, match_key=None, odd_text=None, tracker_key=None):
+        self.bookmaker = bookmaker
+        self.sport = sport
+        self.date = date
+        self.tournament = tournament
+        self.teams = teams
+        self.prediction = prediction
+        self.odd = odd
+        self.value = value
+        self.record_id = record_id
+        self.kickoff = kickoff
+        self.bookmaker_name = bookmaker_name if bookmaker_name is not None else map_bookmaker_name(bookmaker)
+        self.bookmaker_id = bookmaker_id
+        self.match_key = match_key if match_key is not None else make_match_key(sport, date, teams)
+        if odd_text is None:
+            odd_text = str(odd) if odd is not None else ""
+        self.odd_text = odd_text
+        self.tracker_key = tracker_key
+
+    @classmethod
+    def from_row(cls, row, tracker_key=None):
+        """Создает прогноз из словаря строк, полученного парсером; tracker_key - ключ строки в RowTracker."""
+        bookmaker = sys.intern(row.get('bookmaker', '').strip())
+        known = _bookmaker_resolver(bookmaker) if _bookmaker_resolver and bookmaker else None
+        bookmaker_name = known['name'] if known else map_bookmaker_name(bookmaker)
+        date = row.get('date', '').strip()
+        sport = sys.intern(row.get('sport', '').strip())
+        teams = row.get('teams', '').strip()
+        odd_text = row.get('odd', '').strip()
+        return cls(
+            bookmaker=bookmaker,
+            sport=sport,
+            date=date,
+            tournament=sys.intern(row.get('tournament', '').strip()),
+            teams=teams,
+            prediction=row.get('prediction', '').strip(),
+            odd=parse_number(odd_text),
+            value=parse_number(row.get('value', '')),
+            record_id=row.get('record_id', ''),
+            kickoff=parse_kickoff(date),
+            bookmaker_name=bookmaker_name,
+            bookmaker_id=known['id'] if known else None,
+            match_key=make_match_key(sport, date, teams),
+            odd_text=odd_text,
+            tracker_key=tracker_key,
+        )
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return (f"Prediction({self.bookmaker_name!r}, {self.sport!r}, {self.date!r}, {self.teams!r}, "
+                f"{self.prediction!r}, odd={self.odd!r}, value={self.value!r})")
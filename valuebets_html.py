@@ -0,0 +1,296 @@
+import json
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_FIELDS = ('bookmaker', 'sport', 'date', 'tournament', 'teams', 'prediction', 'odd', 'value', 'record_id')
+# Поля, по которым строка узнается, если у tbody нет собственного id
+IDENTITY_FIELDS = ('bookmaker', 'sport', 'date', 'teams', 'prediction')
+# Часовой пояс, в котором сайт показывает время в таблице (московское, без перехода на летнее время)
+SITE_TIMEZONE = timezone(timedelta(hours=3), 'MSK')
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+ROWS_XPATH = etree.XPath(f"//*[@id='valuebets-table']/tbody[{_has_class('valuebet_record')}]")
+# Строки в ответе на запрос таблицы: фрагмент может прийти без самой таблицы
+FRAGMENT_ROWS_XPATH = etree.XPath(f"//tbody[{_has_class('valuebet_record')}]")
+
+# Возможные названия полей прогноза в JSON-ответе
+JSON_FIELD_ALIASES = {
+    'bookmaker': ('bookmaker', 'bookmaker_name', 'bk'),
+    'sport': ('sport', 'sport_name'),
+    'date': ('date', 'time', 'start_at', 'started_at', 'event_time'),
+    'tournament': ('tournament', 'league', 'tournament_name'),
+    'teams': ('teams', 'event', 'event_name', 'name'),
+    'prediction': ('prediction', 'market', 'outcome', 'bet'),
+    'odd': ('odd', 'odds', 'coeff', 'koef'),
+    'value': ('value', 'overvalue', 'profit'),
+    'record_id': ('record_id', 'id'),
+}
+JSON_REQUIRED_FIELDS = ('bookmaker', 'teams', 'prediction', 'odd')
+# Строковые литералы в двойных кавычках из JS-ответа
+JS_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+
+# Элементы, которые браузер в innerText переносит на новую строку
+LINE_BREAK_TAGS = ('br', 'div', 'p')
+
+HTML_PARSER = etree.HTMLParser()
+
+def _text(element):
+    """Текст элемента, приближенный к WebElement.text: пробелы схлопываются, переносы сохраняются."""
+    text = ''.join(element.itertext())
+    if '\n' not in text:
+        return ' '.join(text.split())
+    lines = (' '.join(line.split()) for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def _required(element, selector):
+    if element is None:
+        raise ValueError(f"no such element: {selector}")
+    return element
+
+def parse_row(row):
+    """
+    Разбирает один tbody.valuebet_record в словарь прогноза.
+
+    Строка обходится один раз: каждому CSS-селектору пошагового парсера
+    соответствует первый подходящий элемент в порядке документа.
+    """
+    booker_link = time_cell = event_cell = teams_link = tournament_span = None
+    coeff_cell = value_cell = overvalue_span = None
+    sport = None
+    cell = None
+    cell_classes = ()
+
+    for element in row.iter('td', 'a', 'span'):
+        class_attr = element.get('class')
+        classes = class_attr.split() if class_attr else ()
+        tag = element.tag
+
+        if tag == 'td':
+            cell = element
+            cell_classes = classes
+            if time_cell is None and 'time' in classes:
+                time_cell = element
+            if event_cell is None and 'event' in classes:
+                event_cell = element
+            if coeff_cell is None and 'coeff' in classes:
+                coeff_cell = element
+            if value_cell is None and 'value' in classes:
+                value_cell = element
+            continue
+
+        if tag == 'a':
+            if booker_link is None and 'booker' in cell_classes:
+                booker_link = element
+            if teams_link is None and cell is not None and cell is event_cell:
+                teams_link = element
+            continue
+
+        # span
+        if sport is None and 'minor' in classes:
+            text = _text(element)
+            if '(' not in text and ')' not in text:
+                sport = text
+        if cell is None:
+            continue
+        if overvalue_span is None and 'overvalue' in classes:
+            overvalue_span = element
+        if tournament_span is None and cell is event_cell:
+            tournament_span = element
+
+    event_cell = _required(event_cell, 'td.event')
+    return {
+        'bookmaker': _text(_required(booker_link, 'td.booker a')),
+        'sport': sport or "",
+        'date': _text(_required(time_cell, 'td.time')).replace('\n', ' '),
+        'tournament': _text(_required(tournament_span, 'td.event span')),
+        'teams': _text(_required(teams_link, 'td.event a')),
+        'prediction': _text(_required(coeff_cell, 'td.coeff')),
+        'odd': _text(_required(value_cell, 'td.value')),
+        'value': _text(_required(overvalue_span, 'td span.overvalue')),
+        'record_id': row.get('data-id') or row.get('id') or '',
+    }
+
+def iter_valuebets_html(page_html, on_error=None):
+    """
+    Выдает прогнозы из HTML страницы valuebets (например, driver.page_source) по одной строке.
+    Строки без обязательных ячеек пропускаются, как и при парсинге через WebDriver;
+    on_error(исключение) вызывается для каждой такой строки.
+    """
+    if not page_html:
+        return
+    yield from _iter_rows_html(page_html, ROWS_XPATH, on_error)
+
+def _iter_rows_html(page_html, rows_xpath, on_error=None):
+    document = etree.fromstring(page_html, HTML_PARSER)
+    if document is None:
+        return
+    for element in document.iter(*LINE_BREAK_TAGS):
+        element.tail = '\n' + (element.tail or '')
+        if element.tag != 'br':
+            element.text = '\n' + (element.text or '')
+
+    for row in rows_xpath(document):
+        try:
+            yield parse_row(row)
+        except ValueError as e:
+            logger.warning(f"Ошибка парсинга строки: {e}")
+            if on_error is not None:
+                on_error(e)
+
+def parse_valuebets_html(page_html, on_error=None):
+    """Извлекает все прогнозы из HTML страницы valuebets списком."""
+    return list(iter_valuebets_html(page_html, on_error))
+
+def _js_string(literal):
+    try:
+        # escape_javascript экранирует и одинарные кавычки, которых нет в JSON
+        return json.loads(literal.replace("\\'", "'"))
+    except ValueError:
+        return None
+
+def _json_text(value):
+    """Значение из JSON как строка; числа - без потери точности."""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(value)
+    return str(value).strip()
+
+def _json_date(value):
+    """
+    Дата из JSON в формате таблицы ('25/12 18:30'); ISO и unix-время приводятся к нему.
+    Время с часовым поясом переводится в SITE_TIMEZONE, как в HTML-таблице,
+    независимо от часового пояса сервера.
+    """
+    if isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value / 1000 if value > 1e11 else value, SITE_TIMEZONE)
+        return moment.strftime('%d/%m %H:%M')
+    text = _json_text(value)
+    try:
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return text
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(SITE_TIMEZONE)
+    return moment.strftime('%d/%m %H:%M')
+
+def _json_record(record):
+    """Словарь прогноза из JSON-записи или None, если обязательных полей нет."""
+    prediction = {}
+    for field, aliases in JSON_FIELD_ALIASES.items():
+        value = next((record[alias] for alias in aliases if record.get(alias) not in (None, '')), None)
+        if isinstance(value, dict):
+            value = value.get('name') or value.get('title')
+        prediction[field] = _json_date(value) if field == 'date' and value is not None else _json_text(value)
+    if not all(prediction[field] for field in JSON_REQUIRED_FIELDS):
+        return None
+    return prediction
+
+def _json_records(data):
+    """Ищет в JSON список записей прогнозов (на верхнем уровне или в одном из полей)."""
+    if isinstance(data, list):
+        if data and all(isinstance(item, dict) for item in data):
+            return data
+        return None
+    if isinstance(data, dict):
+        for value in data.values():
+            records = _json_records(value)
+            if records is not None:
+                return records
+    return None
+
+def decode_table_response(body, on_error=None):
+    """
+    Прогнозы из ответа на запрос данных таблицы: HTML (страница или фрагмент
+    со строками tbody.valuebet_record, в том числе внутри JSON или JS-ответа)
+    либо JSON со списком записей. None, если формат не распознан или
+    разобрать не удалось ни одной строки.
+    """
+    if not body:
+        return None
+
+    data = None
+    if body.lstrip()[:1] in ('{', '['):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+
+    if data is not None:
+        fragments = [value for value in (data.values() if isinstance(data, dict) else ())
+                     if isinstance(value, str) and 'valuebet_record' in value]
+        if fragments:
+            return list(_iter_rows_html(fragments[0], FRAGMENT_ROWS_XPATH, on_error)) or None
+        records = _json_records(data)
+        if records is None:
+            return None
+        predictions = [prediction for prediction in map(_json_record, records) if prediction is not None]
+        return predictions or None
+
+    if 'valuebet_record' not in body:
+        return None
+    if not body.lstrip().startswith('<'):
+        # JS-ответ (например, $('#valuebets-table').html("...")) с экранированным HTML
+        body = next((literal for literal in map(_js_string, JS_STRING_RE.findall(body))
+                     if literal and '<tbody' in literal), None)
+        if body is None:
+            return None
+    return list(_iter_rows_html(body, FRAGMENT_ROWS_XPATH, on_error)) or None
+
+def is_logged_in_page(page_html):
+    """Есть ли на странице ссылка выхода, то есть открыта ли сессия."""
+    return 'href="/users/sign_out"' in page_html
+
+def row_key(prediction):
+    """Ключ строки таблицы: id записи, а без него - опознающие поля."""
+    return prediction.get('record_id') or '|'.join(prediction[field] for field in IDENTITY_FIELDS)
+
+def row_fingerprint(prediction):
+    """Хэш содержимого строки для сравнения между опросами (в пределах процесса)."""
+    return hash(tuple(prediction[field] for field in PREDICTION_FIELDS))
+
+def fingerprint_rows(predictions, known_fingerprints=None):
+    """
+    Возвращает (строки для выдачи, отпечатки всех строк).
+    С known_fingerprints выдаются только новые и измененные строки.
+    """
+    fingerprints = {}
+    changed = []
+    for prediction in predictions:
+        key = row_key(prediction)
+        fingerprint = row_fingerprint(prediction)
+        fingerprints[key] = fingerprint
+        if known_fingerprints is None or known_fingerprints.get(key) != fingerprint:
+            changed.append(prediction)
+    return changed, fingerprints
+
+
+class RowTracker:
+    """Отпечатки строк с прошлого опроса: ключ строки -> хэш содержимого."""
+    def __init__(self):
+        self.fingerprints = {}
+
+    def replace(self, fingerprints):
+        """Запоминает новое состояние таблицы и возвращает ключи исчезнувших строк."""
+        removed = [key for key in self.fingerprints if key not in fingerprints]
+        self.fingerprints = fingerprints
+        return removed
+
+    def diff(self, predictions):
+        """Возвращает (новые или измененные строки, ключи исчезнувших строк)."""
+        changed, fingerprints = fingerprint_rows(predictions, self.fingerprints)
+        return changed, self.replace(fingerprints)
+
+    def forget(self, keys):
+        """Забывает строки, чтобы на следующем опросе они пришли снова."""
+        for key in keys:
+            self.fingerprints.pop(key, None)
+
+    def reset(self):
+        self.fingerprints = {}